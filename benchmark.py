@@ -0,0 +1,362 @@
+"""Бенчмарки производительности без обращения к сети
+
+Запуск: python benchmark.py <сценарий> [параметры], список сценариев -
+python benchmark.py --help
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from cbr_replay import ReplayArchiveAdapter, SyntheticArchive, replay_client
+from data_analysis import DataAnalyzer
+from data_processor import DataProcessor
+from dataset_io import (
+    COMPRESSION_EXTENSIONS,
+    DATE_DTYPE,
+    load_dataset,
+    read_rates_csv,
+)
+from partitions import write_partitions
+
+
+def _quiet(func, *args, **kwargs):
+    """Вызвать функцию, подавив построчный вывод print"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args, **kwargs)
+
+
+def bench_download(args):
+    """Пропускная способность и корректность загрузки против копии архива"""
+    end = date(2024, 12, 31)
+    start = end - timedelta(days=args.days - 1)
+    archive = SyntheticArchive()
+    expected = archive.expected_rates(start, end)
+
+    print(
+        f"Загрузка {args.days} дат: задержка {args.latency * 1000:.0f} мс, "
+        f"сбоев {args.error_rate:.0%}, повторов {args.retries}"
+    )
+    print(
+        f"{'потоков':>8} {'дат/с':>9} {'время, с':>9} {'записей':>8} {'ошибок':>7} {'расхождений':>12}"
+    )
+    for workers in args.workers:
+        adapter = ReplayArchiveAdapter(
+            archive.payload, latency=args.latency, error_rate=args.error_rate
+        )
+        client = replay_client(adapter, max_retries=args.retries, backoff_factor=0.01)
+        with tempfile.TemporaryDirectory() as folder:
+            processor = DataProcessor(client=client)
+            processor.dataset_path = folder
+            result = _quiet(
+                processor.download_new_data, start, end, max_workers=workers
+            )
+            saved = pd.read_csv(f"{folder}/dataset.csv")
+
+        actual = dict(zip(saved["Date"], saved["INR_Rate"]))
+        mismatches = sum(
+            1
+            for day, rate in expected.items()
+            if day not in actual or abs(actual[day] - rate) > 1e-9
+        )
+        print(
+            f"{workers:>8} {result['dates_per_second']:>9.1f} "
+            f"{result['elapsed_seconds']:>9.2f} {result['records_count']:>8} "
+            f"{result['errors_count']:>7} {mismatches:>12}"
+        )
+
+
+def _timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def _write_rates_csv(path: str, rows: int, currencies: int):
+    """CSV в формате датасета: Date и столбцы *_Rate"""
+    start = np.datetime64("1900-01-01")
+    # Даты повторяются по кругу, чтобы не выйти за пределы 9999 года
+    dates = (start + np.arange(rows) % 40000).astype(str)
+    df = pd.DataFrame({"Date": dates})
+    rng = np.random.default_rng(0)
+    for i in range(currencies):
+        df[f"C{i:02d}_Rate"] = np.round(rng.uniform(0.1, 100, rows), 4)
+    df.to_csv(path, index=False)
+
+
+def bench_load(args):
+    """Загрузка датасета: разбор без схемы, по схеме и из бинарной копии"""
+
+    def naive(path):
+        df = pd.read_csv(path)
+        df["Date"] = pd.to_datetime(df["Date"])
+        return df
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "dataset.csv")
+        _write_rates_csv(path, args.rows, args.currencies)
+        size_mb = os.path.getsize(path) / 2**20
+        print(f"{args.rows} строк, {args.currencies} валют, CSV {size_mb:.1f} МБ")
+
+        naive_time, expected = _timed(naive, path)
+        schema_time, df = _timed(read_rates_csv, path)
+        pd.testing.assert_frame_equal(df, expected)
+        load_dataset(path)
+        sidecar_time, df = _timed(load_dataset, path)
+        pd.testing.assert_frame_equal(df, expected)
+
+    print(f"{'способ':<28} {'время, с':>9} {'ускорение':>10}")
+    for name, elapsed in (
+        ("read_csv + to_datetime", naive_time),
+        ("read_rates_csv (схема)", schema_time),
+        ("load_dataset (копия .npy)", sidecar_time),
+    ):
+        print(f"{name:<28} {elapsed:>9.3f} {naive_time / elapsed:>9.1f}x")
+
+
+def _legacy_split(df, folder, layout):
+    """Разбиение, как до общего движка: копия, isocalendar, запись по очереди"""
+    df = df.copy()
+    if layout == "years":
+        groups = df.groupby(df["Date"].dt.year)
+    else:
+        df["YearWeek"] = (
+            df["Date"].dt.isocalendar().year.astype(str)
+            + "-"
+            + df["Date"].dt.isocalendar().week.astype(str).str.zfill(2)
+        )
+        groups = df.groupby("YearWeek")
+    columns = [column for column in df.columns if column != "YearWeek"]
+    for _, group in groups:
+        start = group["Date"].min().strftime("%Y%m%d")
+        end = group["Date"].max().strftime("%Y%m%d")
+        group[columns].to_csv(os.path.join(folder, f"{start}_{end}.csv"), index=False)
+
+
+def _same_files(left: str, right: str) -> bool:
+    names = sorted(f for f in os.listdir(left) if f.endswith(".csv"))
+    if names != sorted(f for f in os.listdir(right) if f.endswith(".csv")):
+        return False
+    for name in names:
+        with open(os.path.join(left, name), "rb") as a, open(
+            os.path.join(right, name), "rb"
+        ) as b:
+            if a.read() != b.read():
+                return False
+    return True
+
+
+def bench_split(args):
+    """Разбиение по годам и неделям: прежний цикл и общий параллельный движок"""
+    df = _synthetic_dataset(args.years, args.currencies)
+    print(f"{args.years} лет, {len(df)} строк, {args.currencies} валют")
+
+    print(
+        f"{'разбиение':<10} {'способ':<14} {'время, с':>9} {'ускорение':>10} {'совпадает':>10}"
+    )
+    for layout in ("years", "weeks"):
+        with tempfile.TemporaryDirectory() as legacy_dir:
+            legacy_time, _ = _timed(_legacy_split, df, legacy_dir, layout)
+            print(
+                f"{layout:<10} {'прежний':<14} {legacy_time:>9.3f} {1:>9.1f}x {'-':>10}"
+            )
+            for workers in args.workers:
+                with tempfile.TemporaryDirectory() as folder:
+                    elapsed, _ = _timed(
+                        write_partitions, df, folder, layout, max_workers=workers
+                    )
+                    same = "да" if _same_files(legacy_dir, folder) else "НЕТ"
+                name = f"потоков: {workers}"
+                print(
+                    f"{layout:<10} {name:<14} {elapsed:>9.3f} "
+                    f"{legacy_time / elapsed:>9.1f}x {same:>10}"
+                )
+
+
+def _synthetic_dataset(years: int, currencies: int) -> pd.DataFrame:
+    dates = pd.date_range(end="2024-12-31", periods=years * 365, freq="D")
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({"Date": dates.astype(DATE_DTYPE)})
+    for i in range(currencies):
+        df[f"C{i:02d}_Rate"] = np.round(rng.uniform(0.1, 100, len(df)), 4)
+    return df
+
+
+def bench_compression(args):
+    """Размер и скорость разбиения по неделям при разных способах сжатия"""
+    df = _synthetic_dataset(args.years, args.currencies)
+    print(f"{args.years} лет, {len(df)} строк, {args.currencies} валют, по неделям")
+    print(
+        f"{'сжатие':<8} {'файлов':>7} {'размер, КБ':>11} {'доля':>6} "
+        f"{'запись, с':>10} {'чтение, с':>10}"
+    )
+    plain_size = None
+    for compression in [None] + list(COMPRESSION_EXTENSIONS):
+        with tempfile.TemporaryDirectory() as folder:
+            write_time, entries = _timed(
+                write_partitions, df, folder, "weeks", compression=compression
+            )
+            size = sum(entry["bytes"] for entry in entries)
+            paths = [os.path.join(folder, entry["file"]) for entry in entries]
+            read_time, _ = _timed(lambda: [read_rates_csv(path) for path in paths])
+        plain_size = plain_size or size
+        print(
+            f"{compression or 'нет':<8} {len(entries):>7} {size / 1024:>11.0f} "
+            f"{size / plain_size:>6.0%} {write_time:>10.2f} {read_time:>10.2f}"
+        )
+
+
+def _daily_dataset(rows: int, currencies: int) -> pd.DataFrame:
+    """Датасет с ежедневными датами подряд от 1970-01-01 (до 10M строк и больше)"""
+    days = np.arange(rows, dtype=np.int64).astype("datetime64[D]")
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({"Date": days.astype(DATE_DTYPE)})
+    for i in range(currencies):
+        df["INR_Rate" if i == 0 else f"C{i:02d}_Rate"] = rng.uniform(0.1, 100, rows)
+    return df
+
+
+def bench_lookup(args):
+    """Поиск курса по дате: булева маска, индекс дат и пакетный поиск"""
+
+    def mask_lookup(df, date):
+        result = df[df["Date"] == pd.Timestamp(date)]
+        return result["INR_Rate"].iloc[0] if not result.empty else None
+
+    print(
+        f"{'строк':>10} {'индекс, с':>10} {'маска, мкс':>11} "
+        f"{'индекс, мкс':>12} {'пакет, мкс':>11} {'ускорение':>10}"
+    )
+    rng = np.random.default_rng(1)
+    for rows in args.rows:
+        processor = DataProcessor()
+        processor.current_dataset = _daily_dataset(rows, 1)
+        # Каждая десятая дата - вне датасета; 10M дней выходят за год 9999,
+        # поэтому даты передаются как numpy.datetime64
+        offsets = rng.integers(0, rows + rows // 10, args.lookups)
+        dates = list(offsets.astype("datetime64[D]"))
+
+        build_time, _ = _timed(lambda: processor.date_index)
+        mask_dates = dates[: args.mask_lookups]
+        mask_time, expected = _timed(
+            lambda: [mask_lookup(processor.current_dataset, d) for d in mask_dates]
+        )
+        index_time, found = _timed(
+            lambda: [processor.get_data_by_date(d) for d in dates]
+        )
+        assert found[: len(expected)] == expected
+        batch_time, rates = _timed(processor.get_data_by_dates, dates)
+        np.testing.assert_array_equal(
+            rates, [np.nan if rate is None else rate for rate in found]
+        )
+        mask_us = mask_time / len(mask_dates) * 1e6
+        index_us = index_time / len(dates) * 1e6
+        batch_us = batch_time / len(dates) * 1e6
+        print(
+            f"{rows:>10} {build_time:>10.3f} {mask_us:>11.1f} "
+            f"{index_us:>12.1f} {batch_us:>11.2f} {mask_us / index_us:>9.0f}x"
+        )
+
+
+def bench_range(args):
+    """Выборка по диапазону дат: маска с копией против среза по индексу"""
+
+    def mask_filter(df, start, end):
+        mask = (df["date"] >= start) & (df["date"] <= end)
+        return df[mask].copy()
+
+    processor = DataProcessor()
+    processor.current_dataset = _daily_dataset(args.rows, args.currencies)
+    analyzer = _quiet(DataAnalyzer, processor)
+    build_time, _ = _timed(lambda: analyzer.date_index)
+    print(
+        f"{args.rows} строк, {args.currencies} валют, "
+        f"индекс дат: {build_time:.3f} с"
+    )
+    print(
+        f"{'дней':>6} {'маска, мс':>10} {'срез, мс':>9} "
+        f"{'копия, мс':>10} {'ускорение':>10}"
+    )
+    dates = analyzer.df["date"]
+    for width in args.widths:
+        # Даты идут подряд по дням: диапазон из width дней в середине истории
+        start = dates.iloc[args.rows // 2]
+        end = dates.iloc[args.rows // 2 + width - 1]
+        runs = []
+        for func in (
+            lambda: mask_filter(analyzer.df, start, end),
+            lambda: analyzer.filter_by_date_range(start, end, copy=False),
+            lambda: analyzer.filter_by_date_range(start, end),
+        ):
+            elapsed = min(_timed(_quiet, func)[0] for _ in range(args.repeat))
+            runs.append(elapsed)
+        expected = mask_filter(analyzer.df, start, end)
+        pd.testing.assert_frame_equal(
+            _quiet(analyzer.filter_by_date_range, start, end), expected
+        )
+        mask_ms, slice_ms, copy_ms = (elapsed * 1000 for elapsed in runs)
+        print(
+            f"{width:>6} {mask_ms:>10.2f} {slice_ms:>9.3f} "
+            f"{copy_ms:>10.3f} {mask_ms / slice_ms:>9.0f}x"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="scenario", required=True)
+
+    download = subparsers.add_parser("download", help=bench_download.__doc__)
+    download.add_argument("--days", type=int, default=730)
+    download.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8, 16])
+    download.add_argument("--latency", type=float, default=0.02)
+    download.add_argument("--error-rate", type=float, default=0.02)
+    download.add_argument("--retries", type=int, default=3)
+    download.set_defaults(func=bench_download)
+
+    load = subparsers.add_parser("load", help=bench_load.__doc__)
+    load.add_argument("--rows", type=int, default=2_000_000)
+    load.add_argument("--currencies", type=int, default=3)
+    load.set_defaults(func=bench_load)
+
+    split = subparsers.add_parser("split", help=bench_split.__doc__)
+    split.add_argument("--years", type=int, default=50)
+    split.add_argument("--currencies", type=int, default=5)
+    split.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    split.set_defaults(func=bench_split)
+
+    compression = subparsers.add_parser("compression", help=bench_compression.__doc__)
+    compression.add_argument("--years", type=int, default=20)
+    compression.add_argument("--currencies", type=int, default=5)
+    compression.set_defaults(func=bench_compression)
+
+    lookup = subparsers.add_parser("lookup", help=bench_lookup.__doc__)
+    lookup.add_argument(
+        "--rows",
+        type=int,
+        nargs="+",
+        default=[10_000, 100_000, 1_000_000, 10_000_000],
+    )
+    lookup.add_argument("--lookups", type=int, default=10_000)
+    lookup.add_argument("--mask-lookups", type=int, default=100)
+    lookup.set_defaults(func=bench_lookup)
+
+    date_range = subparsers.add_parser("range", help=bench_range.__doc__)
+    date_range.add_argument("--rows", type=int, default=2_000_000)
+    date_range.add_argument("--currencies", type=int, default=20)
+    date_range.add_argument("--widths", type=int, nargs="+", default=[7, 30, 365])
+    date_range.add_argument("--repeat", type=int, default=5)
+    date_range.set_defaults(func=bench_range)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
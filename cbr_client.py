@@ -0,0 +1,393 @@
+import json
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+ARCHIVE_URL = "https://www.cbr-xml-daily.ru/archive/{date}/daily_json.js"
+HEADERS = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"}
+
+# Кэш общий для GUI, DataProcessor и скрипта lab2_main
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "cbr_archive")
+DEFAULT_CALENDAR_PATH = os.path.join(DEFAULT_CACHE_DIR, "calendar.json")
+# Архивные файлы прошлых дней не меняются, а сегодняшний может обновиться
+TODAY_TTL_SECONDS = 15 * 60
+DEFAULT_MAX_CACHE_BYTES = 256 * 1024 * 1024
+
+# Ответы, после которых имеет смысл повторить запрос
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.5
+# Ограничение частоты запросов к архиву (запросов в секунду)
+DEFAULT_RATE_LIMIT = 25.0
+DEFAULT_POOL_SIZE = 16
+
+
+class FetchError(Exception):
+    """Архив не ответил после всех повторов (сетевая ошибка, а не отсутствие данных)"""
+
+
+def archive_date(date_str: str) -> date:
+    """Дата архива из строки вида 'YYYY/MM/DD'"""
+    return datetime.strptime(date_str, "%Y/%m/%d").date()
+
+
+def parse_rate(payload: dict, code: str = "INR") -> Optional[float]:
+    """Курс валюты из daily_json, приведенный к стандарту 1 единица = X RUB"""
+    valute = payload.get("Valute", {}).get(code)
+    if valute is None:
+        return None
+    # Номинал бывает 1, 10, 100 - приводим к стоимости одной единицы
+    return valute["Value"] / valute["Nominal"]
+
+
+def parse_rates(
+    payload: dict, codes: Optional[Iterable[str]] = None
+) -> Dict[str, float]:
+    """Курсы нескольких валют из одного daily_json (все, если codes не задан)"""
+    valutes = payload.get("Valute", {})
+    if codes is None:
+        codes = sorted(valutes)
+    rates = {}
+    for code in codes:
+        rate = parse_rate(payload, code)
+        if rate is not None:
+            rates[code] = rate
+    return rates
+
+
+class ResponseCache:
+    """Дисковый кэш ответов daily_json.js, ключ - дата архива
+
+    Ответы за прошедшие дни хранятся бессрочно, за сегодняшний день -
+    не дольше today_ttl секунд. При превышении max_bytes удаляются
+    файлы, к которым дольше всего не обращались.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = DEFAULT_CACHE_DIR,
+        max_bytes: int = DEFAULT_MAX_CACHE_BYTES,
+        today_ttl: float = TODAY_TTL_SECONDS,
+    ):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.today_ttl = today_ttl
+        self._lock = threading.Lock()
+        self._total_bytes = None
+
+    def _path(self, date_str: str) -> str:
+        return os.path.join(self.cache_dir, date_str.replace("/", "-") + ".json")
+
+    def get(self, date_str: str) -> Optional[str]:
+        """Текст ответа из кэша или None, если его нет или он устарел"""
+        path = self._path(date_str)
+        try:
+            stat = os.stat(path)
+            if archive_date(date_str) >= date.today():
+                if time.time() - stat.st_mtime > self.today_ttl:
+                    return None
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+            # atime служит отметкой последнего обращения для вытеснения,
+            # mtime остается временем загрузки для TTL
+            os.utime(path, (time.time(), stat.st_mtime))
+            return text
+        except (OSError, ValueError):
+            return None
+
+    def put(self, date_str: str, text: str):
+        """Сохранить ответ в кэш (атомарно, через временный файл)"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(date_str)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+
+        with self._lock:
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+            if self._total_bytes is None:
+                self._total_bytes = self._scan_size()
+            else:
+                self._total_bytes += os.path.getsize(path) - old_size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".json"):
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    entries.append((path, os.stat(path)))
+                except OSError:
+                    pass
+        return entries
+
+    def _scan_size(self) -> int:
+        return sum(stat.st_size for _, stat in self._entries())
+
+    def _evict(self):
+        """Удалить давно не использованные файлы до 90% лимита"""
+        target = self.max_bytes * 0.9
+        for path, stat in sorted(self._entries(), key=lambda e: e[1].st_atime):
+            if self._total_bytes <= target:
+                break
+            try:
+                os.remove(path)
+                self._total_bytes -= stat.st_size
+            except OSError:
+                pass
+
+    def clear(self):
+        """Очистить кэш"""
+        with self._lock:
+            if os.path.isdir(self.cache_dir):
+                for path, _ in self._entries():
+                    os.remove(path)
+            self._total_bytes = 0
+
+
+class PublicationCalendar:
+    """Календарь дней, за которые ЦБ РФ не публикует курсы
+
+    Пополняется по ходу загрузок: дата без файла в архиве (404) и все дни
+    между PreviousDate и датой полученного ответа считаются днями без
+    публикации. Сегодняшние и будущие даты не записываются никогда.
+    Календарь сохраняется в JSON и переиспользуется следующими запусками,
+    чтобы не отправлять запросы, которые заведомо не вернут данных.
+    """
+
+    AUTOSAVE_EVERY = 200
+
+    def __init__(self, path: str = DEFAULT_CALENDAR_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._skipped = None
+        self._unsaved = 0
+
+    def _load(self):
+        if self._skipped is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._skipped = set(json.load(f))
+            except (OSError, ValueError):
+                self._skipped = set()
+
+    def is_skipped(self, date_str: str) -> bool:
+        """Известно ли, что за дату 'YYYY/MM/DD' курсы не публиковались"""
+        with self._lock:
+            self._load()
+            return date_str in self._skipped
+
+    def record_missing(self, date_str: str):
+        """Отметить дату, за которую архив вернул 404"""
+        self._record([archive_date(date_str)], published=None)
+
+    def record_payload(self, date_str: str, payload: dict):
+        """Отметить дни без публикации между PreviousDate и датой ответа"""
+        published = archive_date(date_str)
+        try:
+            current = date.fromisoformat(payload["Date"][:10])
+            previous = date.fromisoformat(payload["PreviousDate"][:10])
+        except (KeyError, TypeError, ValueError):
+            return
+        # Зеркало могло вернуть ответ за другую дату - тогда цепочка не о ней
+        if current != published:
+            return
+        gap = []
+        day = previous + timedelta(days=1)
+        while day < current:
+            gap.append(day)
+            day += timedelta(days=1)
+        self._record(gap, published=published)
+
+    def _record(self, days, published: Optional[date]):
+        today = date.today()
+        with self._lock:
+            self._load()
+            if published is not None:
+                self._skipped.discard(published.strftime("%Y/%m/%d"))
+            for day in days:
+                date_str = day.strftime("%Y/%m/%d")
+                if day < today and date_str not in self._skipped:
+                    self._skipped.add(date_str)
+                    self._unsaved += 1
+            autosave = self._unsaved >= self.AUTOSAVE_EVERY
+        if autosave:
+            self.save()
+
+    def save(self):
+        """Сохранить календарь на диск (атомарно)"""
+        with self._lock:
+            if self._skipped is None or not self._unsaved:
+                return
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(sorted(self._skipped), f)
+            os.replace(tmp_path, self.path)
+            self._unsaved = 0
+
+
+class TokenBucket:
+    """Потокобезопасный ограничитель частоты запросов (token bucket)"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Дождаться свободного токена"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class FetchStats:
+    """Счетчики обращений к архиву"""
+
+    FIELDS = ("cache_hits", "skipped", "fetched", "misses", "retries", "errors")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = dict.fromkeys(self.FIELDS, 0)
+
+    def increment(self, name: str):
+        with self._lock:
+            self._counts[name] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._counts)
+
+
+class CBRClient:
+    """Загрузка daily_json.js из архива ЦБ РФ
+
+    Запросы идут через одну keep-alive сессию с пулом соединений,
+    ограничиваются по частоте и повторяются с экспоненциальной
+    задержкой. Отсутствие файла в архиве (404) - это промах (None),
+    а исчерпание повторов - ошибка FetchError. Даты, которые календарь
+    публикаций знает как нерабочие, сразу возвращают None без запроса.
+    """
+
+    def __init__(
+        self,
+        cache: Optional[ResponseCache] = None,
+        calendar: Optional[PublicationCalendar] = None,
+        timeout: float = 10,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        backoff_factor: float = DEFAULT_BACKOFF_FACTOR,
+        rate_limit: Optional[float] = DEFAULT_RATE_LIMIT,
+        pool_size: int = DEFAULT_POOL_SIZE,
+    ):
+        self.cache = cache
+        self.calendar = calendar
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.rate_limiter = TokenBucket(rate_limit) if rate_limit else None
+        self.stats = FetchStats()
+
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get_daily(self, date_str: str) -> Optional[dict]:
+        """Ответ архива за дату 'YYYY/MM/DD' или None, если файла нет"""
+        text = self.cache.get(date_str) if self.cache is not None else None
+        if text is not None:
+            self.stats.increment("cache_hits")
+            return self._learn(date_str, json.loads(text))
+
+        if self.calendar is not None and self.calendar.is_skipped(date_str):
+            self.stats.increment("skipped")
+            return None
+
+        text = self._download(date_str)
+        if text is None:
+            if self.calendar is not None:
+                self.calendar.record_missing(date_str)
+            return None
+        payload = json.loads(text)
+        if self.cache is not None:
+            self.cache.put(date_str, text)
+        return self._learn(date_str, payload)
+
+    def _learn(self, date_str: str, payload: dict) -> dict:
+        if self.calendar is not None:
+            self.calendar.record_payload(date_str, payload)
+        return payload
+
+    def flush(self):
+        """Сохранить накопленный календарь публикаций"""
+        if self.calendar is not None:
+            self.calendar.save()
+
+    def _download(self, date_str: str) -> Optional[str]:
+        url = ARCHIVE_URL.format(date=date_str)
+        last_error = None
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.stats.increment("retries")
+                time.sleep(self._backoff(attempt, last_error))
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+            except requests.RequestException as e:
+                last_error = e
+                continue
+
+            if response.status_code == 200:
+                self.stats.increment("fetched")
+                return response.content.decode("utf-8")
+            if response.status_code == 404:
+                self.stats.increment("misses")
+                return None
+
+            last_error = response
+            if response.status_code not in RETRY_STATUSES:
+                break
+
+        self.stats.increment("errors")
+        if isinstance(last_error, requests.Response):
+            raise FetchError(f"{date_str}: HTTP {last_error.status_code}")
+        raise FetchError(f"{date_str}: {last_error}")
+
+    def _backoff(self, attempt: int, last_error) -> float:
+        """Задержка перед повтором с учетом заголовка Retry-After"""
+        delay = self.backoff_factor * 2 ** (attempt - 1)
+        if isinstance(last_error, requests.Response):
+            retry_after = last_error.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+        return delay
+
+
+# Общий клиент с кэшем по умолчанию
+default_client = CBRClient(cache=ResponseCache(), calendar=PublicationCalendar())
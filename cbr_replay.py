@@ -0,0 +1,177 @@
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from datetime import date, timedelta
+from typing import Callable, Dict, Iterable, Optional
+
+import requests
+from requests.adapters import BaseAdapter
+
+from cbr_client import ARCHIVE_URL, CBRClient, archive_date
+
+ARCHIVE_PREFIX = ARCHIVE_URL.split("{date}")[0]
+DATE_IN_URL = re.compile(r"/archive/(\d{4}/\d{2}/\d{2})/daily_json\.js")
+
+# Номиналы как у ЦБ РФ: курс рупии публикуется за 100 единиц
+NOMINALS = {"INR": 100, "JPY": 100, "KZT": 100, "AMD": 100}
+DEFAULT_CURRENCIES = ("INR", "USD", "EUR", "CNY", "KZT")
+# ЦБ РФ не публикует курсы по воскресеньям и понедельникам
+DEFAULT_MISSING_WEEKDAYS = (6, 0)
+
+
+def synthetic_rate(day: date, code: str) -> float:
+    """Детерминированный курс 1 единицы валюты за день (RUB)"""
+    base = 0.5 + sum(map(ord, code)) % 97
+    return round(base * (1 + 0.1 * math.sin(day.toordinal() / 45)), 4)
+
+
+class SyntheticArchive:
+    """Синтетический архив daily_json.js с заданными днями без публикаций"""
+
+    def __init__(
+        self,
+        currencies: Iterable[str] = DEFAULT_CURRENCIES,
+        missing_weekdays: Iterable[int] = DEFAULT_MISSING_WEEKDAYS,
+        missing_dates: Iterable[date] = (),
+    ):
+        self.currencies = tuple(currencies)
+        self.missing_weekdays = set(missing_weekdays)
+        self.missing_dates = set(missing_dates)
+
+    def is_published(self, day: date) -> bool:
+        return day.weekday() not in self.missing_weekdays and (
+            day not in self.missing_dates
+        )
+
+    def previous_published(self, day: date) -> date:
+        day -= timedelta(days=1)
+        for _ in range(366):
+            if self.is_published(day):
+                return day
+            day -= timedelta(days=1)
+        return day
+
+    def payload(self, day: date) -> Optional[dict]:
+        """Ответ архива за день или None, если курсы не публиковались"""
+        if not self.is_published(day):
+            return None
+        previous = self.previous_published(day)
+        valute = {}
+        for code in self.currencies:
+            nominal = NOMINALS.get(code, 1)
+            valute[code] = {
+                "CharCode": code,
+                "Nominal": nominal,
+                "Value": round(synthetic_rate(day, code) * nominal, 4),
+                "Previous": round(synthetic_rate(previous, code) * nominal, 4),
+            }
+        return {
+            "Date": f"{day.isoformat()}T11:30:00+03:00",
+            "PreviousDate": f"{previous.isoformat()}T11:30:00+03:00",
+            "PreviousURL": f"//www.cbr-xml-daily.ru/archive/{previous:%Y/%m/%d}/daily_json.js",
+            "Valute": valute,
+        }
+
+    def expected_rates(
+        self, start: date, end: date, code: str = "INR"
+    ) -> Dict[str, float]:
+        """Ожидаемые курсы за период в формате датасета {'YYYY-MM-DD': курс}"""
+        expected = {}
+        day = start
+        while day <= end:
+            if self.is_published(day):
+                expected[day.isoformat()] = synthetic_rate(day, code)
+            day += timedelta(days=1)
+        return expected
+
+
+class ReplayArchiveAdapter(BaseAdapter):
+    """Транспорт requests, отвечающий вместо архива ЦБ РФ без сети
+
+    Ответы берутся из функции day -> payload (например,
+    SyntheticArchive.payload) или из записанных ранее файлов кэша.
+    Можно задать задержку ответа и долю сбоев (таймауты, обрывы, 503),
+    чтобы подбирать число потоков и настройки повторов.
+    """
+
+    def __init__(
+        self,
+        payload_for: Callable[[date], Optional[dict]],
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        super().__init__()
+        self.payload_for = payload_for
+        self.latency = latency
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests_count = 0
+        self.errors_count = 0
+
+    @classmethod
+    def from_cache_dir(cls, cache_dir: str, **kwargs) -> "ReplayArchiveAdapter":
+        """Отвечать записанными ответами из каталога ResponseCache"""
+
+        def payload_for(day: date) -> Optional[dict]:
+            path = os.path.join(cache_dir, f"{day.isoformat()}.json")
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    return json.load(f)
+            except OSError:
+                return None
+
+        return cls(payload_for, **kwargs)
+
+    def send(self, request, **kwargs):
+        with self._lock:
+            self.requests_count += 1
+            failure = self._random.random() < self.error_rate
+            kind = self._random.choice(("timeout", "connection", "503"))
+            if failure:
+                self.errors_count += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        if failure and kind == "timeout":
+            raise requests.Timeout(f"replay: timeout {request.url}", request=request)
+        if failure and kind == "connection":
+            raise requests.ConnectionError(
+                f"replay: reset {request.url}", request=request
+            )
+
+        match = DATE_IN_URL.search(request.url)
+        payload = None
+        if match and not failure:
+            payload = self.payload_for(archive_date(match.group(1)))
+
+        response = requests.Response()
+        response.url = request.url
+        response.request = request
+        if failure:
+            response.status_code = 503
+            response._content = b""
+        elif payload is None:
+            response.status_code = 404
+            response._content = b"Not Found"
+        else:
+            response.status_code = 200
+            response._content = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            response.headers["Content-Type"] = "application/javascript; charset=utf-8"
+        return response
+
+    def close(self):
+        pass
+
+
+def replay_client(adapter: ReplayArchiveAdapter, **client_kwargs) -> CBRClient:
+    """CBRClient, запросы которого обслуживает adapter вместо сети"""
+    client_kwargs.setdefault("rate_limit", None)
+    client = CBRClient(**client_kwargs)
+    client.session.mount(ARCHIVE_PREFIX, adapter)
+    return client
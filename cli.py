@@ -0,0 +1,186 @@
+"""Консольный запуск обработки датасета без GUI
+
+Пример: python cli.py /data/inr download split-years split-weeks stats annotate
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List
+
+from data_analysis import DataAnalyzer
+from data_processor import ALL_CURRENCIES, BACKENDS, DOWNLOAD_MODES, DataProcessor
+from dataset_io import COMPRESSION_EXTENSIONS
+
+# Этапы, которые только читают загруженный датасет и могут идти параллельно
+PARALLEL_STAGES = ("split-xy", "split-years", "split-weeks", "stats", "group-by-month")
+STAGES = ("download", "retry") + PARALLEL_STAGES + ("annotate",)
+
+# Подпапки вывода для разбиений (файлы по годам и неделям называются одинаково)
+LAYOUT_FOLDERS = {"split-xy": "xy", "split-years": "years", "split-weeks": "weeks"}
+
+
+def run_download(processor: DataProcessor, args) -> Dict:
+    currencies = args.currencies
+    if currencies == [ALL_CURRENCIES]:
+        currencies = ALL_CURRENCIES
+    return processor.download_new_data(
+        args.start,
+        args.end,
+        max_workers=args.workers,
+        mode=args.mode,
+        currencies=currencies,
+    )
+
+
+def run_split(processor: DataProcessor, stage: str, output: str) -> Dict:
+    folder = os.path.join(output, LAYOUT_FOLDERS[stage])
+    os.makedirs(folder, exist_ok=True)
+    if stage == "split-xy":
+        return processor.split_to_xy(folder)
+    if stage == "split-years":
+        return processor.split_by_years(folder)
+    return processor.split_by_weeks(folder)
+
+
+def run_stats(processor: DataProcessor, output: str) -> Dict:
+    # У каждого этапа анализа свой DataAnalyzer: он меняет собственную копию
+    analyzer = DataAnalyzer(processor)
+    analyzer.add_deviation_columns()
+    stats = analyzer.calculate_statistics()
+    path = os.path.join(output, "statistics.csv")
+    stats.to_csv(path)
+    return {"success": True, "message": f"Статистики сохранены в {path}"}
+
+
+def run_group_by_month(processor: DataProcessor, output: str) -> Dict:
+    analyzer = DataAnalyzer(processor)
+    analyzer.add_deviation_columns()
+    monthly = analyzer.group_by_month()
+    path = os.path.join(output, "monthly.csv")
+    monthly.to_csv(path, index=False)
+    return {"success": True, "message": f"Группировка по месяцам сохранена в {path}"}
+
+
+def run_annotate(processor: DataProcessor, stages: List[str], output: str) -> Dict:
+    layouts = [("original", processor.dataset_path)]
+    for stage, folder in LAYOUT_FOLDERS.items():
+        layout_path = os.path.join(output, folder)
+        if stage in stages or os.path.isdir(layout_path):
+            layouts.append((folder, layout_path))
+
+    created = []
+    for dataset_type, folder in layouts:
+        path = os.path.join(output, f"annotation_{dataset_type}.txt")
+        result = processor.create_annotation(path, dataset_type, data_path=folder)
+        if "error" in result:
+            return result
+        created.append(path)
+    return {"success": True, "message": f"Создано аннотаций: {len(created)}"}
+
+
+def run_stage(processor: DataProcessor, stage: str, args) -> Dict:
+    """Выполнить этап и вернуть результат в формате DataProcessor"""
+    started = time.perf_counter()
+    print(f"[{stage}] запуск")
+    try:
+        if stage in LAYOUT_FOLDERS:
+            result = run_split(processor, stage, args.output)
+        elif stage == "stats":
+            result = run_stats(processor, args.output)
+        elif stage == "group-by-month":
+            result = run_group_by_month(processor, args.output)
+        else:
+            result = run_annotate(processor, args.stages, args.output)
+    except Exception as e:
+        result = {"error": f"Ошибка этапа {stage}: {e}"}
+    status = result.get("error") or result.get("message")
+    print(f"[{stage}] {time.perf_counter() - started:.2f} с: {status}")
+    return result
+
+
+def parse_date(value: str) -> datetime:
+    return datetime.strptime(value, "%Y-%m-%d")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("folder", help="папка с dataset.csv")
+    parser.add_argument("stages", nargs="+", choices=STAGES, help="этапы обработки")
+    parser.add_argument("--output", help="папка для результатов (по умолчанию folder)")
+    parser.add_argument("--jobs", type=int, default=4, help="параллельных этапов")
+    parser.add_argument("--start", type=parse_date, help="начало загрузки YYYY-MM-DD")
+    parser.add_argument("--end", type=parse_date, help="конец загрузки YYYY-MM-DD")
+    parser.add_argument("--mode", choices=DOWNLOAD_MODES, default="incremental")
+    parser.add_argument("--currencies", nargs="+", help='коды валют или "all"')
+    parser.add_argument("--workers", type=int, default=8, help="потоков загрузки")
+    parser.add_argument(
+        "--compression",
+        choices=("none",) + tuple(COMPRESSION_EXTENSIONS),
+        help="сжатие новых файлов папки (запоминается для папки)",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=BACKENDS,
+        help="хранилище датасета: dataset.csv или SQLite (запоминается для папки)",
+    )
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    args.output = args.output or args.folder
+    os.makedirs(args.output, exist_ok=True)
+
+    # Датасет загружается один раз и общий для всех этапов
+    processor = DataProcessor()
+    if not processor.set_dataset_path(args.folder):
+        if "download" not in args.stages:
+            return 1
+        processor.dataset_path = args.folder
+    for option, setter in (
+        (args.compression, processor.set_compression),
+        (args.backend, processor.set_backend),
+    ):
+        if option:
+            result = setter(option)
+            print(f"[storage] {result.get('error') or result['message']}")
+            if "error" in result:
+                return 1
+
+    # Загрузка и повтор дат из failed_dates.json меняют датасет до остальных этапов
+    results = {}
+    for stage, run in (
+        ("download", lambda: run_download(processor, args)),
+        ("retry", lambda: processor.retry_failed(max_workers=args.workers)),
+    ):
+        if stage not in args.stages:
+            continue
+        results[stage] = run()
+        if "error" in results[stage]:
+            print(f"[{stage}] {results[stage]['error']}")
+            return 1
+        print(f"[{stage}] {results[stage]['message']}")
+
+    parallel = [stage for stage in PARALLEL_STAGES if stage in args.stages]
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+        futures = {
+            stage: executor.submit(run_stage, processor, stage, args)
+            for stage in parallel
+        }
+        for stage, future in futures.items():
+            results[stage] = future.result()
+
+    # Аннотация описывает результаты разбиений, поэтому идет последней
+    if "annotate" in args.stages:
+        results["annotate"] = run_stage(processor, "annotate", args)
+
+    failed = [stage for stage, result in results.items() if "error" in result]
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,6 +6,7 @@ from datetime import datetime
 import os
 from typing import Optional, Tuple
 import warnings
+from dataset_io import DateIndex
 
 warnings.filterwarnings("ignore")
 
@@ -16,6 +17,23 @@ class DataAnalyzer:
         self.df = None
         self._load_and_prepare_data()
 
+    @property
+    def df(self) -> Optional[pd.DataFrame]:
+        return self._df
+
+    @df.setter
+    def df(self, df: Optional[pd.DataFrame]):
+        # Новый DataFrame - новый индекс дат (строится при первом запросе)
+        self._df = df
+        self._date_index = None
+
+    @property
+    def date_index(self) -> DateIndex:
+        """Индекс столбца date для выборок по диапазону дат"""
+        if self._date_index is None or len(self._date_index) != len(self._df):
+            self._date_index = DateIndex(self._df["date"])
+        return self._date_index
+
     def _load_and_prepare_data(self):
         """Загрузка и подготовка данных"""
         if self.data_processor.current_dataset is not None:
@@ -137,13 +155,23 @@ class DataAnalyzer:
 
         return filtered_df
 
-    def filter_by_date_range(self, start_date: str, end_date: str) -> pd.DataFrame:
+    def filter_by_date_range(
+        self, start_date: str, end_date: str, copy: bool = True
+    ) -> pd.DataFrame:
         """
         Фильтрация данных по диапазону дат
 
+        Границы ищутся бинарным поиском по индексу дат, и для
+        отсортированных данных результат - непрерывный срез без
+        сравнения всех строк.
+
         Args:
             start_date: начальная дата (формат: 'YYYY-MM-DD')
             end_date: конечная дата (формат: 'YYYY-MM-DD')
+            copy: вернуть независимую копию. При copy=False возвращается
+                срез self.df без копирования данных; только читайте его:
+                до pandas 3 (без copy-on-write) запись в срез может
+                изменить self.df
 
         Returns:
             Отфильтрованный DataFrame
@@ -156,8 +184,13 @@ class DataAnalyzer:
             start = pd.to_datetime(start_date)
             end = pd.to_datetime(end_date)
 
-            mask = (self.df["date"] >= start) & (self.df["date"] <= end)
-            filtered_df = self.df[mask].copy()
+            rows = self.date_index.between(start, end)
+            if isinstance(rows, slice):
+                filtered_df = self.df.iloc[rows]
+            else:
+                filtered_df = self.df.take(rows)
+            if copy:
+                filtered_df = filtered_df.copy()
 
             print(f"\n=== ФИЛЬТРАЦИЯ ПО ДАТАМ {start_date} - {end_date} ===")
             print(f"Найдено записей: {len(filtered_df)}")
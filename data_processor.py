@@ -1,27 +1,144 @@
 import glob
 import os
+import contextlib
 import csv
+import json
+import sqlite3
+import threading
+import time
+import numpy as np
 import pandas as pd
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-import requests
-from typing import Optional, Tuple, List, Dict
+from itertools import islice
+from typing import Callable, Optional, Tuple, List, Dict, Iterable, Iterator
+from cbr_client import CBRClient, FetchError, default_client, parse_rates
 from data_analysis import DataAnalyzer
+from dataset_io import (
+    COMPRESSION_EXTENSIONS,
+    DateIndex,
+    SchemaError,
+    compress_file,
+    compression_of,
+    count_rows,
+    csv_name,
+    day_numbers,
+    find_csv,
+    get_compression,
+    load_dataset,
+    open_file,
+    read_storage_settings,
+    remove_sidecar,
+    set_compression,
+    update_storage_settings,
+    write_sidecar,
+)
+from partitions import (
+    PARTITION_LAYOUTS,
+    manifest_entries,
+    partition_cache,
+    partition_files,
+    read_manifest,
+    write_columns,
+    write_partitions,
+)
+from sqlite_store import SQLITE_NAME, SQLiteRateStore
+
+# Число одновременных запросов к архиву ЦБ РФ по умолчанию
+DEFAULT_MAX_WORKERS = 8
+
+# Режимы загрузки: полная перезапись, дозагрузка только новых дат или
+# слияние загруженного периода с уже сохраненным датасетом
+DOWNLOAD_MODES = ("replace", "incremental", "merge")
+
+# Хранилища датасета: dataset.csv или база SQLite (выбирается для папки)
+BACKENDS = ("csv", "sqlite")
+
+# Как часто (в секундах) сообщать о ходе загрузки
+PROGRESS_INTERVAL = 0.25
+
+# Как часто (в датах) сбрасывать строки на диск и обновлять чекпоинт загрузки
+CHECKPOINT_EVERY = 100
+# Параметры, по которым чекпоинт относится к той же загрузке; конец периода
+# может быть позже сохраненного (GUI по умолчанию предлагает сегодняшнюю дату)
+CHECKPOINT_KEYS = ("start", "header")
+
+# Очередь дат, не загруженных из-за ошибок сети (лежит рядом с датасетом)
+FAILED_QUEUE_NAME = "failed_dates.json"
+
+# Валюты, загружаемые по умолчанию; "all" - все валюты из ответа ЦБ РФ
+DEFAULT_CURRENCIES = ("INR",)
+ALL_CURRENCIES = "all"
+
+
+def rate_column(code: str) -> str:
+    """Имя столбца курса валюты в датасете (INR -> INR_Rate)"""
+    return f"{code}_Rate"
+
+
+def rate_columns(df: pd.DataFrame) -> List[str]:
+    """Столбцы курсов валют в датасете, в порядке следования"""
+    return [col for col in df.columns if col.endswith("_Rate")]
 
 
 class DataProcessor:
-    def __init__(self):
+    def __init__(self, client: Optional[CBRClient] = None):
         self.dataset_path = None
         self.current_dataset = None
+        # База SQLite, если для папки выбрано хранилище "sqlite"
+        self.store: Optional[SQLiteRateStore] = None
+        # Клиент архива ЦБ РФ; по умолчанию общий, с дисковым кэшем ответов
+        self.client = client if client is not None else default_client
+
+    @property
+    def current_dataset(self) -> Optional[pd.DataFrame]:
+        return self._current_dataset
+
+    @current_dataset.setter
+    def current_dataset(self, df: Optional[pd.DataFrame]):
+        # Любая замена датасета (загрузка, дозагрузка, слияние) сбрасывает
+        # индекс дат; он строится заново при первом поиске
+        self._current_dataset = df
+        self._lookup_cache = None
+
+    @property
+    def date_index(self) -> Optional[DateIndex]:
+        """Индекс дат загруженного датасета для поиска за O(log n)"""
+        df = self._current_dataset
+        if df is None:
+            return None
+        return self._lookup_state(df)[0]
+
+    def _lookup_state(self, df: pd.DataFrame) -> Tuple[DateIndex, Dict]:
+        """Индекс дат и кэш курсов для as-of поиска, построенные по df
+
+        Хранятся вместе с самим датасетом: если поток загрузки подменил
+        датасет, индекс строится заново, а не берется от старого.
+        """
+        cached = self._lookup_cache
+        if cached is None or cached[0] is not df:
+            cached = (df, DateIndex(df["Date"]), {})
+            self._lookup_cache = cached
+        return cached[1], cached[2]
 
     def set_dataset_path(self, folder_path: str) -> bool:
-        """Загрузка dataset.csv из указанной папки"""
+        """Загрузка dataset.csv (в том числе сжатого) из указанной папки"""
         try:
-            dataset_path = os.path.join(folder_path, "dataset.csv")
-            if os.path.exists(dataset_path):
-                self.current_dataset = pd.read_csv(dataset_path)
-                self.current_dataset["Date"] = pd.to_datetime(
-                    self.current_dataset["Date"]
-                )
+            sqlite_path = os.path.join(folder_path, SQLITE_NAME)
+            if read_storage_settings(folder_path).get("backend") == "sqlite" and (
+                os.path.exists(sqlite_path)
+            ):
+                self.store = SQLiteRateStore(sqlite_path)
+                self.current_dataset = self.store.to_dataframe()
+                self.dataset_path = folder_path
+                print(f"Загружено {len(self.current_dataset)} записей из {SQLITE_NAME}")
+                return True
+
+            self.store = None
+            dataset_path = find_csv(folder_path, "dataset.csv")
+            if dataset_path is not None:
+                self.current_dataset = load_dataset(dataset_path)
                 self.dataset_path = folder_path
                 print(f"Загружено {len(self.current_dataset)} записей")
                 return True
@@ -32,23 +149,286 @@ class DataProcessor:
             print(f"Ошибка загрузки данных: {e}")
             return False
 
+    @property
+    def compression(self) -> Optional[str]:
+        """Сжатие новых файлов, выбранное для папки датасета"""
+        return get_compression(self.dataset_path)
+
+    def set_compression(self, compression: Optional[str]) -> Dict[str, str]:
+        """Выбрать сжатие ("gzip", "bz2", "xz" или None) для папки датасета
+
+        Уже записанные файлы не пересжимаются: при чтении сжатие
+        определяется по расширению файла.
+        """
+        if not self.dataset_path:
+            return {"error": "Путь к данным не установлен"}
+        try:
+            set_compression(self.dataset_path, compression)
+        except (OSError, ValueError) as e:
+            return {"error": f"Ошибка: {e}"}
+        return {
+            "success": True,
+            "message": f"Сжатие новых файлов: {self.compression or 'без сжатия'}",
+        }
+
+    @property
+    def backend(self) -> str:
+        """Хранилище датасета: csv или sqlite"""
+        return "sqlite" if self.store is not None else "csv"
+
+    def set_backend(self, backend: str) -> Dict[str, str]:
+        """Выбрать хранилище для папки датасета
+
+        При переходе на SQLite загруженный датасет записывается в базу
+        (upsert: строки базы за другие даты сохраняются), и дальше датасет
+        читается только из базы. При возврате к CSV dataset.csv
+        перезаписывается содержимым базы.
+        """
+        if backend not in BACKENDS:
+            return {"error": f"Неизвестное хранилище: {backend}"}
+        if not self.dataset_path:
+            return {"error": "Путь к данным не установлен"}
+        try:
+            if backend == "sqlite" and self.store is None:
+                store = SQLiteRateStore(os.path.join(self.dataset_path, SQLITE_NAME))
+                if self.current_dataset is not None:
+                    store.import_dataframe(self.current_dataset)
+                self.store = store
+                # Один источник данных: поиск и анализ читают то же, что база
+                self.current_dataset = store.to_dataframe()
+            elif backend == "csv" and self.store is not None:
+                # dataset.csv мог остаться с момента перехода на SQLite и
+                # устареть: датасет всегда выгружается из базы заново
+                dataset = self.store.to_dataframe()
+                dataset_path = os.path.join(
+                    self.dataset_path, csv_name("dataset.csv", self.compression)
+                )
+                tmp_path = dataset_path + ".tmp"
+                dataset.to_csv(tmp_path, index=False, compression=self.compression)
+                os.replace(tmp_path, dataset_path)
+                remove_sidecar(dataset_path)
+                self._remove_other_variants(dataset_path)
+                self.current_dataset = dataset
+                self.store.close()
+                self.store = None
+            update_storage_settings(self.dataset_path, backend=backend)
+        except (OSError, sqlite3.Error) as e:
+            return {"error": f"Ошибка смены хранилища: {e}"}
+        return {"success": True, "message": f"Хранилище датасета: {backend}"}
+
     def get_data_by_date(self, date: datetime) -> Optional[float]:
-        if self.current_dataset is None:
+        if self.store is not None:
+            # Поиск по первичному ключу (date, code) базы
+            return self.store.get_rate(date, "INR")
+        # Один снимок датасета на запрос: позиция и столбец из одной таблицы
+        df = self.current_dataset
+        if df is None:
             return None
 
         try:
-            target_date = pd.Timestamp(date)
-            mask = self.current_dataset["Date"] == target_date
-            result_df = self.current_dataset[mask]
-
-            if not result_df.empty:
-                return result_df["INR_Rate"].iloc[0]
+            position = self._lookup_state(df)[0].position(date)
+            if position is not None:
+                return df["INR_Rate"].values[position]
             else:
                 return None
         except Exception as e:
             print(f"Ошибка поиска: {e}")
             return None
 
+    def get_data_as_of(
+        self, date: datetime, code: str = "INR"
+    ) -> Optional[Tuple[float, datetime]]:
+        """Последний опубликованный курс на дату: (курс, дата публикации)
+
+        В выходные и праздники ЦБ РФ курс не публикует, поэтому
+        возвращается курс ближайшей предыдущей даты, где он есть. None -
+        если дата раньше первого курса в датасете.
+        """
+        rates, effective = self.get_data_as_of_dates([date], code)
+        if np.isnan(rates[0]):
+            return None
+        return float(rates[0]), pd.Timestamp(effective[0]).to_pydatetime()
+
+    def get_data_as_of_dates(
+        self, dates, code: str = "INR"
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Последние опубликованные курсы для списка дат
+
+        Для каждой даты бинарным поиском (searchsorted, side="right")
+        находится последняя строка не позже нее с заполненным курсом.
+        Возвращает массив курсов (NaN - курса нет) и массив дат
+        публикации datetime64[D] (NaT - курса нет) в порядке dates.
+        """
+        days = day_numbers(dates)
+        rates = np.full(len(days), np.nan)
+        effective = np.full(len(days), np.datetime64("NaT"), dtype="datetime64[D]")
+        column = rate_column(code)
+        df = self.current_dataset
+        if df is None or column not in df:
+            return rates, effective
+
+        published_days, published_rates = self._published(df, column)
+        positions = np.searchsorted(published_days, days, side="right") - 1
+        found = positions >= 0
+        rates[found] = published_rates[positions[found]]
+        effective[found] = published_days[positions[found]].astype("datetime64[D]")
+        return rates, effective
+
+    def _published(
+        self, df: pd.DataFrame, column: str
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Отсортированные дни и курсы строк df, где курс валюты заполнен
+
+        Считается один раз на валюту и сбрасывается вместе с индексом дат.
+        """
+        index, as_of_arrays = self._lookup_state(df)
+        if column not in as_of_arrays:
+            values = df[column].to_numpy(dtype=float)
+            if index.order is not None:
+                values = values[index.order]
+            published = ~np.isnan(values)
+            as_of_arrays[column] = (index.days[published], values[published])
+        return as_of_arrays[column]
+
+    def get_data_by_dates(
+        self,
+        dates,
+        layout: str = "single",
+        code: str = "INR",
+        folder: Optional[str] = None,
+    ) -> np.ndarray:
+        """Курсы за список дат одним векторным проходом
+
+        Args:
+            dates: даты (datetime, строки YYYY-MM-DD, numpy/pandas)
+            layout: "single" - загруженный датасет, "xy" - файлы X.csv и
+                Y.csv, "years"/"weeks" - файлы разбиения
+            code: код валюты
+            folder: папка с файлами разбиения (по умолчанию папка датасета)
+
+        Возвращает массив float64 в порядке dates; NaN - курса за дату нет.
+        Каждый файл читается не больше одного раза (и берется из общего
+        кэша partition_cache, если не изменился), а даты ищутся бинарным
+        поиском по индексу дат, без поиска по каждой дате отдельно.
+        """
+        column = rate_column(code)
+        days = day_numbers(dates)
+        result = np.full(len(days), np.nan)
+
+        if layout == "single":
+            df = self.current_dataset
+            if df is not None and column in df:
+                self._fill_rates(
+                    result,
+                    days,
+                    self._lookup_state(df)[0],
+                    df[column].to_numpy(dtype=float),
+                )
+            return result
+
+        folder = folder or self.dataset_path
+        if not folder or not os.path.isdir(folder):
+            return result
+        if layout == "xy":
+            x_path = find_csv(folder, "X.csv")
+            y_path = find_csv(folder, "Y.csv")
+            if x_path is None or y_path is None:
+                return result
+            try:
+                x_dates = partition_cache.read(x_path, usecols=["Date"])["Date"]
+                values = partition_cache.read(
+                    y_path, usecols=[column], require_date=False
+                )[column]
+            except SchemaError as e:
+                print(f"Ошибка чтения X/Y файлов: {e}")
+                return result
+            # Строки X и Y сопоставляются по номеру, поэтому длины должны совпадать
+            if len(x_dates) != len(values):
+                print(
+                    f"Число строк в X.csv ({len(x_dates)}) и Y.csv "
+                    f"({len(values)}) не совпадает"
+                )
+                return result
+            self._fill_rates(
+                result, days, DateIndex(x_dates), values.to_numpy(dtype=float)
+            )
+            return result
+        if layout not in PARTITION_LAYOUTS:
+            raise ValueError(f"Неизвестное разбиение: {layout}")
+
+        for path, selected in self._partition_batches(folder, layout, days):
+            try:
+                df = partition_cache.read(path, usecols=["Date", column])
+            except SchemaError:
+                continue
+            self._fill_rates(
+                result,
+                days,
+                DateIndex(df["Date"]),
+                df[column].to_numpy(dtype=float),
+                selected,
+            )
+        return result
+
+    def _partition_batches(
+        self, folder: str, layout: str, days: np.ndarray
+    ) -> List[Tuple[str, np.ndarray]]:
+        """Файлы разбиения и маски дат, которые нужно в них искать
+
+        По манифесту каждая дата ищется только в файле, чей диапазон ее
+        содержит. Если манифеста нет или файл изменился после его
+        записи, все даты ищутся во всех файлах разбиения.
+        """
+        entries = manifest_entries(folder, layout)
+        if entries:
+            starts = day_numbers([entry["start"] for entry in entries])
+            ends = day_numbers([entry["end"] for entry in entries])
+            owner = np.searchsorted(starts, days, side="right") - 1
+            inside = (owner >= 0) & (days <= ends[np.maximum(owner, 0)])
+            batches = []
+            for i in np.unique(owner[inside]):
+                path = os.path.join(folder, entries[i]["file"])
+                try:
+                    if os.path.getsize(path) != entries[i]["bytes"]:
+                        break
+                except OSError:
+                    break
+                batches.append((path, inside & (owner == i)))
+            else:
+                return batches
+
+        everything = np.ones(len(days), dtype=bool)
+        return [(path, everything) for path in partition_files(folder)]
+
+    def _fill_rates(
+        self,
+        result: np.ndarray,
+        days: np.ndarray,
+        index: DateIndex,
+        values: np.ndarray,
+        selected: Optional[np.ndarray] = None,
+    ):
+        """Записать в result курсы найденных дат, не затирая уже найденные"""
+        positions = index.find(days)
+        found = (positions >= 0) & np.isnan(result)
+        if selected is not None:
+            found &= selected
+        result[found] = values[positions[found]]
+
+    def get_data_by_range(
+        self, start_date: datetime, end_date: datetime
+    ) -> Optional[pd.DataFrame]:
+        """Строки датасета за период [start_date, end_date]"""
+        if self.store is not None:
+            return self.store.get_range(start_date, end_date)
+        df = self.current_dataset
+        if df is None:
+            return None
+        rows = self._lookup_state(df)[0].between(start_date, end_date)
+        if isinstance(rows, slice):
+            return df.iloc[rows]
+        return df.take(rows)
+
     def split_to_xy(self, output_path: str = None) -> Dict[str, str]:
         """Разделение на X.csv и Y.csv"""
         if self.current_dataset is None:
@@ -57,17 +437,17 @@ class DataProcessor:
         path = output_path if output_path else self.dataset_path
 
         try:
-            self.current_dataset[["Date"]].to_csv(
-                os.path.join(path, "X.csv"), index=False
-            )
-            self.current_dataset[["INR_Rate"]].to_csv(
-                os.path.join(path, "Y.csv"), index=False
+            files = write_columns(
+                self.current_dataset,
+                path,
+                {"X.csv": ["Date"], "Y.csv": ["INR_Rate"]},
+                compression=self.compression,
             )
 
             return {
                 "success": True,
-                "message": f"Созданы файлы X.csv и Y.csv в {path}",
-                "files": ["X.csv", "Y.csv"],
+                "message": f"Созданы файлы {' и '.join(files)} в {path}",
+                "files": files,
             }
         except Exception as e:
             return {"error": f"Ошибка: {e}"}
@@ -80,18 +460,10 @@ class DataProcessor:
         path = output_path if output_path else self.dataset_path
 
         try:
-            df = self.current_dataset.copy()
-            created_files = []
-
-            for year, group in df.groupby(df["Date"].dt.year):
-                if not group.empty:
-                    start_date = group["Date"].min().strftime("%Y%m%d")
-                    end_date = group["Date"].max().strftime("%Y%m%d")
-                    filename = f"{start_date}_{end_date}.csv"
-                    filepath = os.path.join(path, filename)
-
-                    group.to_csv(filepath, index=False)
-                    created_files.append(filename)
+            entries = write_partitions(
+                self.current_dataset, path, "years", compression=self.compression
+            )
+            created_files = [entry["file"] for entry in entries]
 
             return {
                 "success": True,
@@ -109,24 +481,14 @@ class DataProcessor:
         path = output_path if output_path else self.dataset_path
 
         try:
-            df = self.current_dataset.copy()
-            created_files = []
-
-            df["YearWeek"] = (
-                df["Date"].dt.isocalendar().year.astype(str)
-                + "-"
-                + df["Date"].dt.isocalendar().week.astype(str).str.zfill(2)
+            entries = write_partitions(
+                self.current_dataset,
+                path,
+                "weeks",
+                columns=["Date", "INR_Rate"],
+                compression=self.compression,
             )
-
-            for week, group in df.groupby("YearWeek"):
-                if not group.empty:
-                    start_date = group["Date"].min().strftime("%Y%m%d")
-                    end_date = group["Date"].max().strftime("%Y%m%d")
-                    filename = f"{start_date}_{end_date}.csv"
-                    filepath = os.path.join(path, filename)
-
-                    group[["Date", "INR_Rate"]].to_csv(filepath, index=False)
-                    created_files.append(filename)
+            created_files = [entry["file"] for entry in entries]
 
             return {
                 "success": True,
@@ -137,58 +499,52 @@ class DataProcessor:
             return {"error": f"Ошибка: {e}"}
 
     def create_annotation(
-        self, annotation_path: str, dataset_type: str = "original"
+        self,
+        annotation_path: str,
+        dataset_type: str = "original",
+        data_path: Optional[str] = None,
     ) -> Dict[str, str]:
-        """Создание файла аннотации"""
+        """Создание файла аннотации
+
+        Args:
+            annotation_path: путь к создаваемому файлу аннотации
+            dataset_type: "original", "xy", "years" или "weeks"
+            data_path: папка с файлами датасета (по умолчанию папка dataset.csv)
+        """
         try:
-            if not self.dataset_path:
+            folder = data_path if data_path else self.dataset_path
+            if not folder:
                 return {"error": "Путь к данным не установлен"}
 
-            if dataset_type == "original":
-                files = (
+            if dataset_type in ("original", "xy"):
+                names = (
                     ["dataset.csv"]
-                    if os.path.exists(os.path.join(self.dataset_path, "dataset.csv"))
-                    else []
+                    if dataset_type == "original"
+                    else ["X.csv", "Y.csv"]
                 )
-            elif dataset_type == "xy":
-                files = [
-                    f
-                    for f in ["X.csv", "Y.csv"]
-                    if os.path.exists(os.path.join(self.dataset_path, f))
-                ]
-            elif dataset_type == "years":
-                files = [
-                    f
-                    for f in os.listdir(self.dataset_path)
-                    if f.endswith(".csv")
-                    and f not in ["X.csv", "Y.csv", "dataset.csv"]
-                    and len(f) == 16
-                ]
-            elif dataset_type == "weeks":
-                files = [
-                    f
-                    for f in os.listdir(self.dataset_path)
-                    if f.endswith(".csv")
-                    and f not in ["X.csv", "Y.csv", "dataset.csv"]
-                    and len(f) == 16
-                ]
+                paths = [find_csv(folder, name) for name in names]
+                files = [os.path.basename(path) for path in paths if path is not None]
+            elif dataset_type in ("years", "weeks"):
+                files = [os.path.basename(path) for path in partition_files(folder)]
             else:
                 files = []
 
+            # Для разбиений по годам/неделям число строк берется из манифеста
+            # (GUI не различает эти типы, поэтому смотрим оба раздела)
+            metadata = {}
+            if dataset_type in PARTITION_LAYOUTS:
+                for entries in read_manifest(folder).values():
+                    metadata.update((entry["file"], entry) for entry in entries)
+
             with open(annotation_path, "w", encoding="utf-8") as f:
                 f.write(f"Аннотация датасета\n")
                 f.write("=" * 50 + "\n")
                 f.write(f"Тип организации: {dataset_type}\n")
-                f.write(f"Путь к данным: {self.dataset_path}\n")
+                f.write(f"Путь к данным: {folder}\n")
                 f.write(f"Количество файлов: {len(files)}\n")
                 f.write("Файлы:\n")
                 for file in files:
-                    file_path = os.path.join(self.dataset_path, file)
-                    if os.path.exists(file_path):
-                        df = pd.read_csv(file_path)
-                        f.write(f"  - {file}: {len(df)} записей\n")
-                    else:
-                        f.write(f"  - {file}: файл не найден\n")
+                    f.write(f"  - {self._describe_file(folder, file, metadata)}\n")
                 f.write(f"\nСоздано: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
 
             return {
@@ -200,13 +556,63 @@ class DataProcessor:
         except Exception as e:
             return {"error": f"Ошибка создания аннотации: {e}"}
 
-    def download_new_data(self, start_date=None, end_date=None) -> Dict[str, str]:
-        """Скачать новые данные с ЦБ РФ с ограничением по датам"""
+    def _describe_file(self, folder: str, file: str, metadata: Dict) -> str:
+        """Строка аннотации для файла: записи из манифеста или подсчет строк"""
+        file_path = os.path.join(folder, file)
+        try:
+            size = os.path.getsize(file_path)
+        except OSError:
+            return f"{file}: файл не найден"
+
+        entry = metadata.get(file)
+        if entry is not None and entry.get("bytes") == size:
+            line = f"{file}: {entry['rows']} записей ({entry['start']} - {entry['end']}"
+            if entry.get("crc32") is not None:
+                line += f", crc32 {entry['crc32']:08x}"
+            return line + ")"
+        return f"{file}: {count_rows(file_path)} записей"
+
+    def download_new_data(
+        self,
+        start_date=None,
+        end_date=None,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        mode: str = "replace",
+        currencies=None,
+        progress_callback: Optional[Callable[[dict], None]] = None,
+        cancel_event: Optional[threading.Event] = None,
+    ) -> Dict[str, str]:
+        """Скачать новые данные с ЦБ РФ с ограничением по датам
+
+        Args:
+            start_date: начальная дата (по умолчанию 2016-01-01)
+            end_date: конечная дата (по умолчанию сегодня)
+            max_workers: число одновременных запросов к архиву ЦБ РФ
+            mode: "replace" - перезаписать dataset.csv за указанный период,
+                "incremental" - скачать только даты после последней
+                загруженной и дописать их в конец dataset.csv,
+                "merge" - скачать период и слить его с dataset.csv (при
+                совпадении дат побеждают новые значения)
+            currencies: список кодов валют (по умолчанию INR, а при
+                дозагрузке - валюты из dataset.csv) или "all". Все валюты
+                берутся из одного ответа ЦБ РФ за день, в датасет пишется
+                столбец <КОД>_Rate на каждую валюту.
+            progress_callback: вызывается из потока загрузки со словарем
+                {"done", "total", "dates_per_second", "eta_seconds"}
+            cancel_event: threading.Event для отмены; уже загруженное
+                в режиме "merge" сразу сливается с dataset.csv, в остальных
+                режимах остается в чекпоинте, и повторный запуск с тем же
+                началом периода продолжит с него
+        """
         try:
             if not self.dataset_path:
                 return {"error": "Сначала выберите папку для сохранения данных"}
 
-            print("Начинаем сбор данных по курсу индийской рупии (INR)...")
+            if max_workers < 1:
+                return {"error": "Число потоков загрузки должно быть не меньше 1"}
+
+            if mode not in DOWNLOAD_MODES:
+                return {"error": f"Неизвестный режим загрузки: {mode}"}
 
             # Используем переданные даты или значения по умолчанию
             if end_date is None:
@@ -214,60 +620,796 @@ class DataProcessor:
             if start_date is None:
                 start_date = datetime(2016, 1, 1)
 
+            start_date = pd.Timestamp(start_date).to_pydatetime()
+            end_date = pd.Timestamp(end_date).to_pydatetime()
+
             # Добавьте проверку, что start_date не позже end_date
             if start_date > end_date:
                 return {"error": "Начальная дата не может быть позже конечной"}
 
-            dates = self._generate_date_range(start_date, end_date)
-            data = []
+            if self.store is not None:
+                return self._download_to_store(
+                    start_date,
+                    end_date,
+                    max_workers,
+                    mode,
+                    currencies,
+                    progress_callback,
+                    cancel_event,
+                )
 
-            for date_str in dates:
-                rate = self._get_inr_rate(date_str)
-                if rate is not None:
-                    formatted_date = date_str.replace("/", "-")
-                    data.append([formatted_date, rate])
-                    print(f" {formatted_date}: {rate} RUB")
+            existing_path = find_csv(self.dataset_path, "dataset.csv")
+            append = (
+                mode == "incremental"
+                and self.current_dataset is not None
+                and not self.current_dataset.empty
+                and existing_path is not None
+            )
+            # Дописываем в существующий файл; полная загрузка пишет файл со
+            # сжатием, выбранным для папки сейчас
+            dataset_path = (
+                existing_path
+                if append
+                else os.path.join(
+                    self.dataset_path, csv_name("dataset.csv", self.compression)
+                )
+            )
+            merge = (
+                mode == "merge"
+                and existing_path is not None
+                and self.current_dataset is not None
+            )
+            if merge and currencies is None:
+                # По умолчанию обновляем те же валюты, что уже есть в датасете
+                currencies = [
+                    col[: -len("_Rate")] for col in rate_columns(self.current_dataset)
+                ] or None
+            if append:
+                existing_codes = [
+                    col[: -len("_Rate")] for col in rate_columns(self.current_dataset)
+                ]
+                # Столбцы дописываемого файла уже заданы его заголовком
+                if currencies in (None, ALL_CURRENCIES):
+                    currencies = existing_codes
+                elif self._resolve_currencies(currencies, end_date) != existing_codes:
+                    return {
+                        "error": "Набор валют не совпадает с dataset.csv: "
+                        f"{', '.join(existing_codes)}"
+                    }
+
+                next_date = self.current_dataset["Date"].max() + timedelta(days=1)
+                start_date = max(start_date, next_date.to_pydatetime())
+                if start_date > end_date:
+                    return {
+                        "success": True,
+                        "message": "Новых данных нет: датасет уже актуален",
+                        "records_count": 0,
+                    }
+
+            codes = self._resolve_currencies(currencies, end_date)
+            if not codes:
+                return {"error": "Не удалось определить список валют"}
+            header = ["Date"] + [rate_column(code) for code in codes]
+            print(f"Начинаем сбор данных по курсам валют ({', '.join(codes)})...")
+
+            requested = dates = self._generate_date_range(start_date, end_date)
+            state = {
+                "start": start_date.strftime("%Y-%m-%d"),
+                "end": end_date.strftime("%Y-%m-%d"),
+                "header": header,
+                "last_date": None,
+                "bytes": 0,
+                "records_count": 0,
+                "missing_count": 0,
+                "failed_dates": [],
+            }
+            # Загрузка идет в несжатый .part-файл: его можно обрезать до чекпоинта
+            plain_path = os.path.join(self.dataset_path, "dataset.csv")
+            part_path = plain_path + ".part"
+            checkpoint_path = plain_path + ".checkpoint"
+
+            if append:
+                target_path = dataset_path
+                self._ensure_trailing_newline(dataset_path)
+            else:
+                # Прерванная загрузка того же периода продолжается с чекпоинта
+                target_path = part_path
+                saved = self._load_checkpoint(checkpoint_path, state)
+                if saved is not None and os.path.exists(part_path):
+                    state = saved
+                    dates = [d for d in dates if d > state["last_date"]]
+                    print(
+                        f"Продолжаем прерванную загрузку после {state['last_date']} "
+                        f"(уже сохранено {state['records_count']} записей)"
+                    )
+                    # Строки, записанные после последнего чекпоинта, отбрасываем
+                    os.truncate(part_path, state["bytes"])
                 else:
-                    print(f"--- {date_str}: данные не найдены")
+                    with open(part_path, "w", newline="", encoding="utf-8") as f:
+                        csv.writer(f).writerow(header)
 
-            dataset_path = os.path.join(self.dataset_path, "dataset.csv")
+            started = time.perf_counter()
+            new_rows, processed = self._stream_rows(
+                target_path,
+                dates,
+                codes,
+                max_workers,
+                state,
+                checkpoint_path=None if append else checkpoint_path,
+                keep_rows=append,
+                progress_callback=progress_callback,
+                cancel_event=cancel_event,
+            )
+            cancelled = cancel_event is not None and cancel_event.is_set()
+            # Сохраняем календарь публикаций, накопленный за загрузку
+            self.client.flush()
+            elapsed = time.perf_counter() - started
 
-            with open(dataset_path, "w", newline="", encoding="utf-8") as csvfile:
-                writer = csv.writer(csvfile)
-                writer.writerow(["Date", "INR_Rate"])
-                writer.writerows(data)
+            # Незавершенная полная загрузка хранит ошибки в чекпоинте
+            if append or merge or not cancelled:
+                self._update_failed_queue(
+                    requested, state, codes, reset=mode == "replace"
+                )
 
-            self.set_dataset_path(self.dataset_path)
+            if append:
+                self._extend_dataset(new_rows, header)
+                # Бинарная копия обновляется из памяти, без разбора CSV
+                try:
+                    write_sidecar(dataset_path, self.current_dataset)
+                except OSError as e:
+                    # Строки уже дописаны в CSV, копия пересоберется при чтении
+                    print(f"Не удалось сохранить бинарную копию {dataset_path}: {e}")
+                message = f"Успешно дописано {len(new_rows)} записей в dataset.csv"
+            elif cancelled and not merge:
+                message = (
+                    f"Загрузка отменена: {state['records_count']} записей сохранено "
+                    f"до {state['last_date']}, повторный запуск продолжит с этого места"
+                )
+            else:
+                # Готовый файл подменяет dataset.csv атомарно
+                merged = self._install_part(
+                    part_path, dataset_path, existing_path if merge else None
+                )
+                if os.path.exists(checkpoint_path):
+                    os.remove(checkpoint_path)
+                self.set_dataset_path(self.dataset_path)
+                message = (
+                    f"Успешно сохранено {state['records_count']} записей в dataset.csv"
+                )
+                if merge:
+                    total, replaced = merged
+                    message = (
+                        f"Успешно объединено: {state['records_count']} загруженных "
+                        f"записей (обновлено {replaced}), всего {total} в dataset.csv"
+                    )
+                if merge and cancelled:
+                    # При слиянии загруженное до отмены сразу попадает в датасет
+                    message = (
+                        f"Загрузка отменена: {state['records_count']} записей до "
+                        f"{state['last_date']} объединены с dataset.csv "
+                        f"(всего {total})"
+                    )
 
-            return {
-                "success": True,
-                "message": f"Успешно сохранено {len(data)} записей в dataset.csv",
-                "records_count": len(data),
-            }
+            return self._download_summary(
+                state, processed, elapsed, max_workers, codes, cancelled, message
+            )
         except Exception as e:
             return {"error": f"Ошибка загрузки данных: {e}"}
 
-    def _get_inr_rate(self, date_str):
-        """Получить курс INR с ЦБ РФ и привести к стандарту 1 INR = X RUB"""
-        url = f"https://www.cbr-xml-daily.ru/archive/{date_str}/daily_json.js"
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+    def _download_to_store(
+        self,
+        start_date: datetime,
+        end_date: datetime,
+        max_workers: int,
+        mode: str,
+        currencies,
+        progress_callback: Optional[Callable[[dict], None]] = None,
+        cancel_event: Optional[threading.Event] = None,
+    ) -> Dict:
+        """Загрузка в SQLite: строки записываются upsert'ом пачками
+
+        Чекпоинты не нужны: записанные пачки уже в базе, а режим
+        "incremental" продолжает с последней даты в ней. Даты вне
+        запрошенного периода в базе сохраняются в обоих режимах.
+        """
+        if mode == "incremental":
+            last_date = self.store.last_date()
+            if last_date is not None:
+                start_date = max(start_date, last_date + timedelta(days=1))
+                if start_date > end_date:
+                    return {
+                        "success": True,
+                        "message": "Новых данных нет: датасет уже актуален",
+                        "records_count": 0,
+                    }
+            if currencies is None:
+                currencies = self.store.currencies() or None
+
+        codes = self._resolve_currencies(currencies, end_date)
+        if not codes:
+            return {"error": "Не удалось определить список валют"}
+        print(f"Начинаем сбор данных по курсам валют ({', '.join(codes)})...")
+
+        state = {
+            "last_date": None,
+            "records_count": 0,
+            "missing_count": 0,
+            "failed_dates": [],
         }
+        dates = self._generate_date_range(start_date, end_date)
+        started = time.perf_counter()
+        _, processed = self._stream_rows(
+            None,
+            dates,
+            codes,
+            max_workers,
+            state,
+            store=self.store,
+            progress_callback=progress_callback,
+            cancel_event=cancel_event,
+        )
+        cancelled = cancel_event is not None and cancel_event.is_set()
+        self.client.flush()
+        elapsed = time.perf_counter() - started
+        # Даты вне периода остаются в базе, поэтому и их ошибки остаются в очереди
+        self._update_failed_queue(dates, state, codes)
+
+        self.current_dataset = self.store.to_dataframe()
+        message = f"Успешно сохранено {state['records_count']} записей в {SQLITE_NAME}"
+        if cancelled:
+            message = (
+                f"Загрузка отменена: {state['records_count']} записей сохранено "
+                f"в {SQLITE_NAME}, повторный запуск продолжит с этого места"
+            )
+        return self._download_summary(
+            state, processed, elapsed, max_workers, codes, cancelled, message
+        )
+
+    def get_failed_dates(self) -> List[str]:
+        """Даты из очереди повторной загрузки (YYYY/MM/DD по возрастанию)"""
+        return sorted(self._load_failed_queue())
+
+    def retry_failed(
+        self,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        progress_callback: Optional[Callable[[dict], None]] = None,
+        cancel_event: Optional[threading.Event] = None,
+    ) -> Dict[str, str]:
+        """Повторно загрузить только даты из очереди failed_dates.json
+
+        Даты запрашиваются параллельно, как при обычной загрузке, и
+        сливаются с dataset.csv (или записываются в SQLite) без
+        перезагрузки всего периода. Загруженные даты и даты, за которые
+        ЦБ РФ подтвердил отсутствие данных, удаляются из очереди; даты с
+        повторной ошибкой сети остаются в ней.
+        """
         try:
-            response = requests.get(url, headers=headers, timeout=10)
-            if response.status_code == 200:
-                data = response.json()
-                nominal = data["Valute"]["INR"][
-                    "Nominal"
-                ]  # получаем номинал (1, 10, 100)
-                value = data["Valute"]["INR"]["Value"]  # получаем значение
-                # Приводим к стоимости 1 INR
-                rate_per_one = value / nominal
-                return rate_per_one
+            if not self.dataset_path:
+                return {"error": "Сначала выберите папку для сохранения данных"}
+
+            if max_workers < 1:
+                return {"error": "Число потоков загрузки должно быть не меньше 1"}
+
+            queue = self._load_failed_queue()
+            if not queue:
+                return {
+                    "success": True,
+                    "message": "Нет дат для повторной загрузки",
+                    "records_count": 0,
+                }
+
+            # Даты с одинаковым набором валют загружаются за один проход
+            groups = {}
+            for date_str in sorted(queue):
+                groups.setdefault(tuple(queue[date_str]), []).append(date_str)
+            print(f"Повторная загрузка {len(queue)} дат из {FAILED_QUEUE_NAME}...")
+
+            state = {
+                "last_date": None,
+                "bytes": 0,
+                "records_count": 0,
+                "missing_count": 0,
+                "failed_dates": [],
+            }
+            processed = 0
+            cancelled = False
+            started = time.perf_counter()
+            for group_codes, dates in groups.items():
+                codes = list(group_codes)
+                # Ошибки копятся в state за все группы; в очередь каждой группы
+                # попадают только ее даты, со своим набором валют
+                failed_before = len(state["failed_dates"])
+                if self.store is not None:
+                    _, done = self._stream_rows(
+                        None,
+                        dates,
+                        codes,
+                        max_workers,
+                        state,
+                        store=self.store,
+                        progress_callback=progress_callback,
+                        cancel_event=cancel_event,
+                    )
+                else:
+                    part_path = os.path.join(self.dataset_path, "dataset.csv.retry")
+                    with open(part_path, "w", newline="", encoding="utf-8") as f:
+                        csv.writer(f).writerow(
+                            ["Date"] + [rate_column(code) for code in codes]
+                        )
+                    written = state["records_count"]
+                    _, done = self._stream_rows(
+                        part_path,
+                        dates,
+                        codes,
+                        max_workers,
+                        state,
+                        progress_callback=progress_callback,
+                        cancel_event=cancel_event,
+                    )
+                    if state["records_count"] > written:
+                        # Загруженные строки сливаются с датасетом (или становятся им)
+                        self._install_part(
+                            part_path,
+                            os.path.join(
+                                self.dataset_path,
+                                csv_name("dataset.csv", self.compression),
+                            ),
+                            find_csv(self.dataset_path, "dataset.csv"),
+                        )
+                    else:
+                        os.remove(part_path)
+                processed += done
+                self._update_failed_queue(
+                    dates[:done],
+                    state,
+                    codes,
+                    failed=state["failed_dates"][failed_before:],
+                )
+                cancelled = cancel_event is not None and cancel_event.is_set()
+                if cancelled:
+                    break
+            self.client.flush()
+            elapsed = time.perf_counter() - started
+
+            if self.store is not None:
+                self.current_dataset = self.store.to_dataframe()
             else:
-                return None
-        except Exception:
+                self.set_dataset_path(self.dataset_path)
+            remaining = len(self._load_failed_queue())
+            message = (
+                f"Повторно загружено {state['records_count']} записей, "
+                f"в очереди осталось {remaining} дат"
+            )
+            if cancelled:
+                message = "Повторная загрузка отменена: " + message
+            all_codes = sorted({code for codes in groups for code in codes})
+            result = self._download_summary(
+                state, processed, elapsed, max_workers, all_codes, cancelled, message
+            )
+            result["queued_count"] = remaining
+            return result
+        except Exception as e:
+            return {"error": f"Ошибка повторной загрузки: {e}"}
+
+    def _load_failed_queue(self) -> Dict[str, List[str]]:
+        """Очередь {дата: коды валют} или пустой словарь"""
+        if not self.dataset_path:
+            return {}
+        try:
+            with open(
+                os.path.join(self.dataset_path, FAILED_QUEUE_NAME),
+                "r",
+                encoding="utf-8",
+            ) as f:
+                return json.load(f).get("dates", {})
+        except (OSError, ValueError, AttributeError):
+            return {}
+
+    def _update_failed_queue(
+        self,
+        dates: List[str],
+        state: dict,
+        codes: List[str],
+        reset: bool = False,
+        failed: Optional[List[str]] = None,
+    ):
+        """Обновить очередь по итогам загрузки dates
+
+        Обработанные даты (до state["last_date"] включительно) удаляются из
+        очереди, даты с ошибкой сети (failed, по умолчанию
+        state["failed_dates"]) добавляются с валютами codes. При reset
+        старая очередь отбрасывается: датасет перезаписан целиком.
+        """
+        queue = {} if reset else self._load_failed_queue()
+        last_date = state["last_date"]
+        if last_date is not None:
+            for date_str in dates:
+                if date_str <= last_date:
+                    queue.pop(date_str, None)
+        for date_str in state["failed_dates"] if failed is None else failed:
+            queue[date_str] = list(codes)
+
+        path = os.path.join(self.dataset_path, FAILED_QUEUE_NAME)
+        if not queue:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"dates": dict(sorted(queue.items()))}, f, indent=1)
+        os.replace(tmp_path, path)
+
+    def _download_summary(
+        self,
+        state: dict,
+        processed: int,
+        elapsed: float,
+        max_workers: int,
+        codes: List[str],
+        cancelled: bool,
+        message: str,
+    ) -> Dict:
+        """Итог загрузки в формате результата download_new_data"""
+        dates_per_second = processed / elapsed if elapsed > 0 else 0.0
+        print(
+            f"Обработано {processed} дат за {elapsed:.1f} с "
+            f"({dates_per_second:.1f} дат/с, потоков: {max_workers})"
+        )
+        failed_dates = state["failed_dates"]
+        if failed_dates:
+            print(f"Не удалось загрузить {len(failed_dates)} дат из-за ошибок сети")
+
+        return {
+            "success": True,
+            "cancelled": cancelled,
+            "message": message,
+            "records_count": state["records_count"],
+            "dates_count": processed,
+            "elapsed_seconds": elapsed,
+            "dates_per_second": dates_per_second,
+            "missing_count": state["missing_count"],
+            "errors_count": len(failed_dates),
+            "failed_dates": failed_dates,
+            "currencies": codes,
+        }
+
+    def _stream_rows(
+        self,
+        target_path: str,
+        dates: List[str],
+        codes: List[str],
+        max_workers: int,
+        state: dict,
+        checkpoint_path: Optional[str] = None,
+        keep_rows: bool = False,
+        progress_callback: Optional[Callable[[dict], None]] = None,
+        cancel_event: Optional[threading.Event] = None,
+        store: Optional[SQLiteRateStore] = None,
+    ) -> Tuple[List[list], int]:
+        """Загрузить даты и дописывать строки в target_path пачками
+
+        Каждые CHECKPOINT_EVERY дат пачка сбрасывается на диск (fsync), а в
+        checkpoint_path записывается последняя обработанная дата и размер
+        файла, до которого данные гарантированно целы. Если задан store,
+        пачки записываются в SQLite вместо файла. При установке
+        cancel_event загрузка останавливается после текущей даты.
+        Возвращает сохраненные строки (при keep_rows) и число обработанных дат.
+        """
+        kept = []
+        batch = []
+        total = len(dates)
+        started = time.perf_counter()
+        last_report = 0.0
+        processed = 0
+        output = (
+            contextlib.nullcontext()
+            if store is not None
+            else open_file(target_path, "a", newline="", encoding="utf-8")
+        )
+        with output as csvfile:
+            writer = csv.writer(csvfile) if store is None else None
+
+            def flush_batch():
+                if store is not None:
+                    store.upsert_rows(batch, codes)
+                else:
+                    writer.writerows(batch)
+                    csvfile.flush()
+                    os.fsync(csvfile.fileno())
+                    state["bytes"] = os.fstat(csvfile.fileno()).st_size
+                batch.clear()
+                if checkpoint_path is not None and state["last_date"] is not None:
+                    self._save_checkpoint(checkpoint_path, state)
+
+            for processed, (date_str, rates, error) in enumerate(
+                self._fetch_rates(dates, codes, max_workers), start=1
+            ):
+                if error is not None:
+                    state["failed_dates"].append(date_str)
+                    print(f"!!! {date_str}: ошибка загрузки ({error})")
+                elif rates:
+                    formatted_date = date_str.replace("/", "-")
+                    row = [formatted_date] + [rates.get(code, "") for code in codes]
+                    batch.append(row)
+                    if keep_rows:
+                        kept.append(row)
+                    state["records_count"] += 1
+                    if len(codes) == 1:
+                        print(f" {formatted_date}: {rates[codes[0]]} RUB")
+                    else:
+                        print(f" {formatted_date}: {len(rates)} валют")
+                else:
+                    state["missing_count"] += 1
+                    print(f"--- {date_str}: данные не найдены")
+
+                state["last_date"] = date_str
+                if processed % CHECKPOINT_EVERY == 0:
+                    flush_batch()
+
+                now = time.perf_counter()
+                if progress_callback is not None and (
+                    now - last_report >= PROGRESS_INTERVAL or processed == total
+                ):
+                    last_report = now
+                    rate = processed / (now - started) if now > started else 0.0
+                    progress_callback(
+                        {
+                            "done": processed,
+                            "total": total,
+                            "dates_per_second": rate,
+                            "eta_seconds": (total - processed) / rate if rate else None,
+                        }
+                    )
+                if cancel_event is not None and cancel_event.is_set():
+                    print("Загрузка отменена пользователем")
+                    break
+            flush_batch()
+        return kept, processed
+
+    def _load_checkpoint(self, checkpoint_path: str, params: dict) -> Optional[dict]:
+        """Состояние прерванной загрузки с тем же началом периода и столбцами
+
+        Чекпоинт подходит, если сохраненные строки не выходят за конец
+        нового периода.
+        """
+        try:
+            with open(checkpoint_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        same_run = all(state.get(key) == params[key] for key in CHECKPOINT_KEYS)
+        last_date = state.get("last_date")
+        if not same_run or not last_date or last_date.replace("/", "-") > params["end"]:
             return None
+        # Загрузка продолжается до конца нового периода
+        state["end"] = params["end"]
+        return state
+
+    def _save_checkpoint(self, checkpoint_path: str, state: dict):
+        """Атомарно записать чекпоинт загрузки"""
+        tmp_path = checkpoint_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, checkpoint_path)
+
+    def _merge_files(
+        self, existing_path: str, new_path: str, target_path: str
+    ) -> Tuple[int, int]:
+        """Слить два отсортированных по дате CSV за один проход
+
+        Строки читаются из обоих файлов потоково и пишутся во временный
+        файл, который затем атомарно подменяет target_path. При совпадении
+        дат значения из new_path заменяют старые; столбцы, которых нет в
+        new_path, сохраняются. Возвращает (строк всего, строк обновлено).
+        """
+        tmp_path = target_path + ".tmp"
+        try:
+            total, replaced = self._merge_rows(
+                existing_path, new_path, tmp_path, compression_of(target_path)
+            )
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        os.replace(tmp_path, target_path)
+        return total, replaced
+
+    def _merge_rows(
+        self,
+        existing_path: str,
+        new_path: str,
+        tmp_path: str,
+        compression: Optional[str],
+    ) -> Tuple[int, int]:
+        """Записать слияние existing_path и new_path в tmp_path"""
+        total = replaced = 0
+        with open_file(existing_path, "r", newline="", encoding="utf-8") as old_f, open(
+            new_path, "r", newline="", encoding="utf-8"
+        ) as new_f, open_file(
+            tmp_path,
+            "w",
+            compression=compression,
+            newline="",
+            encoding="utf-8",
+        ) as out:
+            old_rows = (row for row in csv.reader(old_f) if row)
+            new_rows = (row for row in csv.reader(new_f) if row)
+            old_header = next(old_rows, ["Date"])
+            new_header = next(new_rows, ["Date"])
+            header = old_header + [c for c in new_header[1:] if c not in old_header]
+            old_pos = {column: i for i, column in enumerate(old_header)}
+            new_pos = {column: i for i, column in enumerate(new_header)}
+
+            def widen(row, positions, base=None):
+                merged = list(base) if base is not None else [""] * len(header)
+                for i, column in enumerate(header):
+                    if column in positions and positions[column] < len(row):
+                        value = row[positions[column]]
+                        # Пустое новое значение (курс не опубликован) не
+                        # затирает сохраненный курс
+                        if value != "" or base is None:
+                            merged[i] = value
+                return merged
+
+            def sorted_rows(rows, path):
+                previous = None
+                for row in rows:
+                    if previous is not None and row[0] < previous:
+                        raise ValueError(f"Даты в {path} не отсортированы")
+                    previous = row[0]
+                    yield row
+
+            old_rows = sorted_rows(old_rows, existing_path)
+            new_rows = sorted_rows(new_rows, new_path)
+            writer = csv.writer(out)
+            writer.writerow(header)
+            old_row = next(old_rows, None)
+            new_row = next(new_rows, None)
+            while old_row is not None or new_row is not None:
+                if new_row is None or (old_row is not None and old_row[0] < new_row[0]):
+                    writer.writerow(widen(old_row, old_pos))
+                    old_row = next(old_rows, None)
+                elif old_row is None or new_row[0] < old_row[0]:
+                    writer.writerow(widen(new_row, new_pos))
+                    new_row = next(new_rows, None)
+                else:
+                    base = widen(old_row, old_pos)
+                    writer.writerow(widen(new_row, new_pos, base))
+                    replaced += 1
+                    old_row = next(old_rows, None)
+                    new_row = next(new_rows, None)
+                total += 1
+        return total, replaced
+
+    def _install_part(
+        self, part_path: str, dataset_path: str, merge_with: Optional[str] = None
+    ) -> Optional[Tuple[int, int]]:
+        """Подменить dataset_path загруженным .part-файлом
+
+        Если задан merge_with, файл сливается с ним (см. _merge_files) и
+        возвращается (строк всего, строк обновлено). Копии dataset.csv с
+        другим сжатием удаляются.
+        """
+        merged = None
+        if merge_with is not None:
+            merged = self._merge_files(merge_with, part_path, dataset_path)
+            os.remove(part_path)
+        elif compression_of(dataset_path) is None:
+            os.replace(part_path, dataset_path)
+        else:
+            compress_file(part_path, dataset_path)
+            os.remove(part_path)
+        self._remove_other_variants(dataset_path)
+        return merged
+
+    def _remove_other_variants(self, dataset_path: str):
+        """Удалить dataset.csv с другим сжатием, чтобы не читать устаревший"""
+        folder = os.path.dirname(dataset_path)
+        for compression in [None] + list(COMPRESSION_EXTENSIONS):
+            path = os.path.join(folder, csv_name("dataset.csv", compression))
+            if path != dataset_path and os.path.exists(path):
+                os.remove(path)
+                remove_sidecar(path)
+
+    def _ensure_trailing_newline(self, path: str):
+        """Дописать перевод строки, если файл заканчивается без него"""
+        if compression_of(path) is not None:
+            # Сжатые файлы пишет только загрузчик, и они всегда завершены
+            return
+        with open(path, "rb+") as f:
+            if f.seek(0, os.SEEK_END) > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) not in (b"\n", b"\r"):
+                    f.write(b"\r\n")
+
+    def _extend_dataset(self, rows: List[list], header: List[str]):
+        """Добавить новые строки в загруженный DataFrame без перечитывания CSV"""
+        if not rows:
+            return
+        new_rows = pd.DataFrame(rows, columns=header)
+        new_rows["Date"] = pd.to_datetime(new_rows["Date"], format="%Y-%m-%d")
+        # Пустые курсы - NaN, а столбцы - float64, иначе бинарная копия
+        # не запишется из-за столбцов типа object
+        for column in header[1:]:
+            new_rows[column] = pd.to_numeric(
+                new_rows[column].replace("", float("nan"))
+            ).astype("float64")
+        self.current_dataset = pd.concat(
+            [self.current_dataset, new_rows], ignore_index=True
+        )
+
+    def _fetch_rates(
+        self, dates: Iterable[str], codes: List[str], max_workers: int
+    ) -> Iterator[Tuple[str, Optional[Dict[str, float]], Optional[Exception]]]:
+        """Запросить курсы параллельно, выдавая результаты в порядке дат
+
+        Для каждой даты выдается (дата, курсы, ошибка): пустые курсы без
+        ошибки означают, что данных за дату в архиве нет. Одновременно в
+        работе держится не больше max_workers * 2 запросов, поэтому память
+        не растет с длиной диапазона.
+        """
+        date_iter = iter(dates)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = deque(
+                (date_str, executor.submit(self._fetch_one, date_str, codes))
+                for date_str in islice(date_iter, max_workers * 2)
+            )
+            try:
+                while pending:
+                    date_str, future = pending.popleft()
+                    for next_date in islice(date_iter, 1):
+                        pending.append(
+                            (
+                                next_date,
+                                executor.submit(self._fetch_one, next_date, codes),
+                            )
+                        )
+                    yield (date_str, *future.result())
+            finally:
+                # При отмене или ошибке не ждем запросов, которые еще не начались
+                for _, future in pending:
+                    future.cancel()
+
+    def _fetch_one(
+        self, date_str: str, codes: List[str]
+    ) -> Tuple[Optional[Dict[str, float]], Optional[Exception]]:
+        try:
+            return self._get_rates(date_str, codes), None
+        except (FetchError, ValueError, KeyError) as e:
+            return None, e
+
+    def _get_rates(self, date_str: str, codes: List[str]) -> Dict[str, float]:
+        """Курсы указанных валют за дату из одного ответа ЦБ РФ
+
+        Возвращает пустой словарь, если за дату нет данных; при сетевой
+        ошибке после всех повторов выбрасывает FetchError.
+        """
+        payload = self.client.get_daily(date_str)
+        return parse_rates(payload, codes) if payload is not None else {}
+
+    def _get_inr_rate(self, date_str):
+        """Получить курс INR с ЦБ РФ и привести к стандарту 1 INR = X RUB"""
+        return self._get_rates(date_str, ["INR"]).get("INR")
+
+    def _resolve_currencies(self, currencies, end_date: datetime) -> List[str]:
+        """Список кодов валют для загрузки
+
+        Для "all" берутся валюты из последнего опубликованного ответа
+        не позже end_date, чтобы столбцы были известны до начала загрузки.
+        """
+        if currencies is None:
+            return list(DEFAULT_CURRENCIES)
+        if isinstance(currencies, str) and currencies != ALL_CURRENCIES:
+            currencies = [currencies]
+        if currencies != ALL_CURRENCIES:
+            return [code.upper() for code in currencies]
+
+        for days_back in range(14):
+            date_str = (end_date - timedelta(days=days_back)).strftime("%Y/%m/%d")
+            payload = self.client.get_daily(date_str)
+            if payload is not None:
+                return sorted(payload.get("Valute", {}))
+        return []
 
     def _generate_date_range(self, start_date, end_date):
         """Сгенерировать диапазон дат"""
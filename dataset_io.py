@@ -0,0 +1,436 @@
+import bz2
+import csv
+import gzip
+import json
+import lzma
+import os
+import shutil
+from typing import List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+# Схема файлов датасета: столбец Date в ISO-формате и столбцы курсов *_Rate
+DATE_COLUMN = "Date"
+DATE_FORMAT = "%Y-%m-%d"
+RATE_SUFFIX = "_Rate"
+
+# Сжатие файлов выбирается для папки датасета (storage.json), а при чтении
+# определяется по расширению файла
+COMPRESSION_EXTENSIONS = {"gzip": ".gz", "bz2": ".bz2", "xz": ".xz"}
+COMPRESSION_OPENERS = {"gzip": gzip.open, "bz2": bz2.open, "xz": lzma.open}
+STORAGE_SETTINGS = "storage.json"
+
+# Бинарная копия CSV лежит рядом с ним: dataset.csv -> .dataset.csv.cache/
+SIDECAR_VERSION = 1
+# Тип дат, который дает pd.to_datetime для строк в установленной версии pandas
+DATE_DTYPE = pd.to_datetime(pd.Series(["2000-01-01"])).dtype
+
+
+class SchemaError(ValueError):
+    """Заголовок CSV не соответствует схеме датасета"""
+
+
+def compression_of(path: str) -> Optional[str]:
+    """Сжатие файла по расширению или None для обычного файла"""
+    for compression, extension in COMPRESSION_EXTENSIONS.items():
+        if path.endswith(extension):
+            return compression
+    return None
+
+
+def open_file(path: str, mode: str = "r", compression: Optional[str] = None, **kwargs):
+    """open() с прозрачным сжатием (по расширению или явно заданным)"""
+    compression = compression or compression_of(path)
+    if compression is None:
+        return open(path, mode, **kwargs)
+    if "b" not in mode and "t" not in mode:
+        mode += "t"
+    return COMPRESSION_OPENERS[compression](path, mode, **kwargs)
+
+
+def read_storage_settings(folder: Optional[str]) -> dict:
+    """Настройки хранения папки датасета из storage.json"""
+    if not folder:
+        return {}
+    try:
+        with open(os.path.join(folder, STORAGE_SETTINGS), "r", encoding="utf-8") as f:
+            settings = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return settings if isinstance(settings, dict) else {}
+
+
+def update_storage_settings(folder: str, **values):
+    """Изменить настройки хранения папки, сохранив остальные"""
+    settings = read_storage_settings(folder)
+    settings.update(values)
+    path = os.path.join(folder, STORAGE_SETTINGS)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(settings, f)
+    os.replace(tmp_path, path)
+
+
+def get_compression(folder: Optional[str]) -> Optional[str]:
+    """Сжатие, выбранное для папки датасета, или None"""
+    compression = read_storage_settings(folder).get("compression")
+    return compression if compression in COMPRESSION_EXTENSIONS else None
+
+
+def set_compression(folder: str, compression: Optional[str]):
+    """Выбрать сжатие для новых файлов папки ("gzip", "bz2", "xz" или None)"""
+    if compression == "none":
+        compression = None
+    if compression is not None and compression not in COMPRESSION_EXTENSIONS:
+        raise ValueError(f"Неизвестный способ сжатия: {compression}")
+    update_storage_settings(folder, compression=compression)
+
+
+def csv_name(name: str, compression: Optional[str]) -> str:
+    """Имя файла с расширением сжатия: dataset.csv -> dataset.csv.gz"""
+    return name + COMPRESSION_EXTENSIONS.get(compression, "")
+
+
+def find_csv(folder: str, name: str) -> Optional[str]:
+    """Путь к существующему файлу name в папке, сжатому или нет
+
+    Сначала проверяется вариант со сжатием, выбранным для папки.
+    """
+    preferred = get_compression(folder)
+    variants = [preferred] + [None] + list(COMPRESSION_EXTENSIONS)
+    for compression in dict.fromkeys(variants):
+        path = os.path.join(folder, csv_name(name, compression))
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def compress_file(source: str, target: str):
+    """Атомарно записать сжатую копию source в target (сжатие по расширению)"""
+    tmp_path = target + ".tmp"
+    with open(source, "rb") as src, open_file(
+        tmp_path, "wb", compression=compression_of(target)
+    ) as dst:
+        shutil.copyfileobj(src, dst, 1 << 20)
+    os.replace(tmp_path, target)
+
+
+def read_header(csv_path: str) -> List[str]:
+    """Названия столбцов из первой строки CSV"""
+    with open_file(csv_path, "r", encoding="utf-8", newline="") as f:
+        return next(csv.reader(f), [])
+
+
+def count_rows(csv_path: str, chunk_size: int = 1 << 20) -> int:
+    """Число строк данных в CSV (без заголовка) без разбора файла
+
+    Файл читается блоками, в которых считаются переводы строк; последняя
+    строка без перевода строки тоже учитывается.
+    """
+    newlines = 0
+    last = b"\n"
+    with open_file(csv_path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            newlines += chunk.count(b"\n")
+            last = chunk[-1:]
+    if last != b"\n":
+        newlines += 1
+    return max(newlines - 1, 0)
+
+
+def parse_dates(values) -> pd.Series:
+    """Разобрать даты одним векторным проходом по известному формату"""
+    try:
+        return pd.to_datetime(values, format=DATE_FORMAT)
+    except ValueError:
+        # Даты со временем (например, "2020-01-01 00:00:00") - тоже ISO
+        return pd.to_datetime(values, format="ISO8601")
+
+
+def read_rates_csv(
+    csv_path: str,
+    usecols: Optional[Sequence[str]] = None,
+    require_date: bool = True,
+) -> pd.DataFrame:
+    """Прочитать CSV датасета по схеме
+
+    Заголовок проверяется один раз до разбора: нужен столбец Date (если
+    require_date) и все столбцы из usecols. Курсы *_Rate читаются сразу
+    как float64, даты разбираются по формату DATE_FORMAT без угадывания.
+    """
+    header = read_header(csv_path)
+    if require_date and DATE_COLUMN not in header:
+        raise SchemaError(f"В {csv_path} нет столбца {DATE_COLUMN}")
+    columns = list(usecols) if usecols is not None else header
+    missing = [column for column in columns if column not in header]
+    if missing:
+        raise SchemaError(f"В {csv_path} нет столбцов: {', '.join(missing)}")
+
+    dtype = {column: "float64" for column in columns if column.endswith(RATE_SUFFIX)}
+    if DATE_COLUMN in columns:
+        dtype[DATE_COLUMN] = "str"
+    df = pd.read_csv(csv_path, usecols=columns, dtype=dtype)[columns]
+    if DATE_COLUMN in columns:
+        df[DATE_COLUMN] = parse_dates(df[DATE_COLUMN])
+    return df
+
+
+def sidecar_dir(csv_path: str) -> str:
+    """Папка бинарной копии для CSV-файла"""
+    folder, name = os.path.split(csv_path)
+    return os.path.join(folder, f".{name}.cache")
+
+
+def _source_stamp(csv_path: str) -> dict:
+    stat = os.stat(csv_path)
+    return {"source_size": stat.st_size, "source_mtime_ns": stat.st_mtime_ns}
+
+
+def _save_array(path: str, array: np.ndarray):
+    # Новый файл подменяет старый целиком: процессы, уже отобразившие
+    # старый файл в память, продолжают читать его без ошибок
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+def write_sidecar(csv_path: str, df: pd.DataFrame) -> bool:
+    """Сохранить столбцовую копию датасета рядом с CSV
+
+    Даты хранятся как int64 (дни от 1970-01-01), курсы - матрицей float64,
+    в .npy-файлах, которые можно отображать в память (см. RateStore).
+    В meta.json записываются размер и mtime CSV, по которым копия
+    проверяется при чтении. Возвращает False, если датасет не
+    подходит для бинарного хранения (нет Date, нечисловые столбцы, время
+    внутри дня).
+    """
+    if "Date" not in df.columns or not pd.api.types.is_datetime64_any_dtype(df["Date"]):
+        return False
+    value_columns = [col for col in df.columns if col != "Date"]
+    if not all(pd.api.types.is_numeric_dtype(df[col]) for col in value_columns):
+        return False
+
+    dates = df["Date"].values.astype("datetime64[D]")
+    if not (dates == df["Date"].values).all():
+        return False
+
+    folder = sidecar_dir(csv_path)
+    meta_path = os.path.join(folder, "meta.json")
+    os.makedirs(folder, exist_ok=True)
+    # Сначала убираем meta.json: без него полузаписанная копия невалидна
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+
+    _save_array(os.path.join(folder, "dates.npy"), dates.astype(np.int64))
+    # Столбцы хранятся подряд (порядок Fortran): курс одной валюты - это
+    # непрерывный участок файла
+    values = df[value_columns].to_numpy(dtype=np.float64).reshape(len(df), -1)
+    _save_array(os.path.join(folder, "values.npy"), np.asfortranarray(values))
+
+    meta = {"version": SIDECAR_VERSION, "columns": value_columns}
+    meta.update(_source_stamp(csv_path))
+    tmp_path = meta_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, meta_path)
+    return True
+
+
+def read_sidecar_meta(csv_path: str) -> Optional[dict]:
+    """meta.json бинарной копии, если она соответствует текущему CSV"""
+    try:
+        with open(os.path.join(sidecar_dir(csv_path), "meta.json")) as f:
+            meta = json.load(f)
+        stamp = _source_stamp(csv_path)
+    except (OSError, ValueError):
+        return None
+    if meta.get("version") != SIDECAR_VERSION:
+        return None
+    if any(meta.get(key) != value for key, value in stamp.items()):
+        return None
+    return meta
+
+
+def read_sidecar(csv_path: str) -> Optional[pd.DataFrame]:
+    """Датасет из бинарной копии или None, если копии нет или она устарела"""
+    meta = read_sidecar_meta(csv_path)
+    if meta is None:
+        return None
+    folder = sidecar_dir(csv_path)
+    try:
+        dates = np.load(os.path.join(folder, "dates.npy"))
+        values = np.load(os.path.join(folder, "values.npy"))
+    except (OSError, ValueError):
+        return None
+
+    df = pd.DataFrame({"Date": dates.astype("datetime64[D]").astype(DATE_DTYPE)})
+    for i, column in enumerate(meta["columns"]):
+        df[column] = values[:, i]
+    return df
+
+
+def remove_sidecar(csv_path: str):
+    """Удалить бинарную копию CSV"""
+    shutil.rmtree(sidecar_dir(csv_path), ignore_errors=True)
+
+
+def load_dataset(
+    csv_path: str,
+    use_sidecar: bool = True,
+    usecols: Optional[Sequence[str]] = None,
+) -> pd.DataFrame:
+    """Загрузить датасет, предпочитая бинарную копию разбору CSV
+
+    Если копии нет или CSV изменился после ее записи, CSV разбирается
+    по схеме (read_rates_csv), и копия перезаписывается для следующих
+    открытий. usecols ограничивает возвращаемые столбцы.
+    """
+    df = read_sidecar(csv_path) if use_sidecar else None
+    if df is None:
+        df = read_rates_csv(csv_path)
+        if use_sidecar:
+            try:
+                write_sidecar(csv_path, df)
+            except OSError as e:
+                print(f"Не удалось сохранить бинарную копию {csv_path}: {e}")
+
+    if usecols is None:
+        return df
+    missing = [column for column in usecols if column not in df.columns]
+    if missing:
+        raise SchemaError(f"В {csv_path} нет столбцов: {', '.join(missing)}")
+    return df[list(usecols)]
+
+
+def day_numbers(dates) -> np.ndarray:
+    """Даты как int64 - номера дней от 1970-01-01, как в бинарной копии"""
+    days = pd.to_datetime(pd.Series(dates)).values.astype("datetime64[D]")
+    return days.astype(np.int64)
+
+
+def find_days(days: np.ndarray, wanted: np.ndarray) -> np.ndarray:
+    """Позиции wanted в отсортированном массиве days; -1 для отсутствующих"""
+    if not len(days):
+        return np.full(len(wanted), -1, dtype=np.int64)
+    positions = np.minimum(np.searchsorted(days, wanted), len(days) - 1)
+    return np.where(days[positions] == wanted, positions, -1)
+
+
+class DateIndex:
+    """Отсортированные номера дней для поиска строк DataFrame по дате
+
+    Строится за один проход по столбцу дат (с сортировкой, только если
+    даты не упорядочены), после чего поиск даты - бинарный поиск за
+    O(log n) без булевой маски по всему датасету. При повторах даты
+    находится первая строка, как при фильтрации по маске.
+    """
+
+    def __init__(self, dates):
+        days = day_numbers(dates)
+        self.order = None
+        if len(days) > 1 and (np.diff(days) < 0).any():
+            self.order = np.argsort(days, kind="stable")
+            days = days[self.order]
+        self.days = days
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    def position(self, date) -> Optional[int]:
+        """Номер строки (для iloc) с датой или None"""
+        day = np.datetime64(pd.Timestamp(date), "D").astype(np.int64)
+        i = int(np.searchsorted(self.days, day))
+        if i == len(self.days) or self.days[i] != day:
+            return None
+        return int(self.order[i]) if self.order is not None else i
+
+    def positions(self, dates) -> np.ndarray:
+        """Номера строк для списка дат; -1 для отсутствующих"""
+        return self.find(day_numbers(dates))
+
+    def between(self, start, end):
+        """Строки с датами в [start, end]
+
+        Для отсортированных дат - срез slice(lo, hi) по двум бинарным
+        поискам, иначе - номера строк по возрастанию (как у маски).
+        """
+        first = np.datetime64(pd.Timestamp(start).ceil("D"), "D").astype(np.int64)
+        last = np.datetime64(pd.Timestamp(end).floor("D"), "D").astype(np.int64)
+        lo = int(np.searchsorted(self.days, first, side="left"))
+        hi = max(lo, int(np.searchsorted(self.days, last, side="right")))
+        if self.order is None:
+            return slice(lo, hi)
+        return np.sort(self.order[lo:hi])
+
+    def find(self, days: np.ndarray) -> np.ndarray:
+        """Номера строк для номеров дней (см. day_numbers); -1 для отсутствующих"""
+        found = find_days(self.days, days)
+        if self.order is not None:
+            found = np.where(found >= 0, self.order[found], -1)
+        return found
+
+
+class RateStore:
+    """Курсы из бинарной копии датасета, отображенные в память
+
+    DataFrame не создается: даты и курсы читаются через numpy.memmap,
+    поэтому несколько процессов делят одну копию в кэше страниц ОС, а
+    поиск по дате - бинарный поиск по отсортированным номерам дней.
+    Если даты в файле не отсортированы, в памяти строится перестановка
+    для поиска (при повторах находится первая строка).
+
+    При create=False бинарная копия не создается: если ее нет или она
+    устарела, выбрасывается ValueError.
+    """
+
+    def __init__(self, csv_path: str, create: bool = True):
+        meta = read_sidecar_meta(csv_path)
+        if meta is None and create:
+            # Разбираем CSV один раз; load_dataset сохранит бинарную копию
+            load_dataset(csv_path)
+            meta = read_sidecar_meta(csv_path)
+        if meta is None:
+            raise ValueError(f"Нет бинарной копии для {csv_path}")
+
+        folder = sidecar_dir(csv_path)
+        self.csv_path = csv_path
+        self.columns = list(meta["columns"])
+        self.days = np.load(os.path.join(folder, "dates.npy"), mmap_mode="r")
+        self.values = np.load(os.path.join(folder, "values.npy"), mmap_mode="r")
+        self.order = None
+        self.sorted_days = self.days
+        if len(self.days) > 1 and (np.diff(self.days) < 0).any():
+            self.order = np.argsort(self.days, kind="stable")
+            self.sorted_days = np.asarray(self.days)[self.order]
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    def column_index(self, code: str = "INR") -> int:
+        """Номер столбца валюты: принимает 'USD' или 'USD_Rate'"""
+        column = code if code in self.columns else f"{code.upper()}_Rate"
+        try:
+            return self.columns.index(column)
+        except ValueError:
+            raise KeyError(f"Валюта {code} отсутствует в {self.csv_path}")
+
+    def lookup(self, date, code: str = "INR") -> Optional[float]:
+        """Курс за дату или None, если даты нет в датасете"""
+        value = self.lookup_many([date], code)[0]
+        return None if np.isnan(value) else float(value)
+
+    def lookup_many(self, dates, code: str = "INR") -> np.ndarray:
+        """Курсы за список дат; для отсутствующих дат - NaN"""
+        column = self.column_index(code)
+        positions = find_days(self.sorted_days, day_numbers(dates))
+        result = np.full(len(positions), np.nan)
+        found = positions >= 0
+        if self.order is not None:
+            positions = np.where(found, self.order[positions], -1)
+        result[found] = self.values[positions[found], column]
+        return result
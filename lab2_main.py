@@ -4,13 +4,15 @@ import csv
 import pandas as pd
 from datetime import datetime, timedelta
 
-import requests
+from cbr_client import default_client, parse_rate
+from dataset_io import DateIndex, RateStore, load_dataset, read_rates_csv
+from partitions import files_for_date, write_columns, write_partitions
 
 
 def split_to_xy():
 
     # Загружаем данные
-    df = pd.read_csv("dataset.csv")
+    df = load_dataset("dataset.csv")
 
     # Проверяем структуру данных
     print("Структура данных:")
@@ -18,8 +20,7 @@ def split_to_xy():
     print(f"Всего строк: {len(df)}")
 
     # Разделяем на X.csv (даты) и Y.csv (данные)
-    df[["Date"]].to_csv("X.csv", index=False)
-    df[["INR_Rate"]].to_csv("Y.csv", index=False)
+    write_columns(df, ".", {"X.csv": ["Date"], "Y.csv": ["INR_Rate"]})
 
     print("✓ Созданы файлы:")
     print("  - X.csv (даты)")
@@ -33,28 +34,17 @@ def split_by_years():
 
     # Загружаем данные
     try:
-        df = pd.read_csv("dataset.csv")
+        df = load_dataset("dataset.csv")
         print("✓ dataset.csv успешно загружен")
         print(f"Колонки: {df.columns.tolist()}")
         print(f"Первые строки:\n{df.head()}")
-
-        # Преобразуем даты
-        df["Date"] = pd.to_datetime(df["Date"])
         print(f"Диапазон дат: от {df['Date'].min()} до {df['Date'].max()}")
 
         print("\nРазделение по годам:")
 
-        # Группируем по году
-        for year, group in df.groupby(df["Date"].dt.year):
-            if not group.empty:
-                # Форматируем даты для названия файла
-                start_date = group["Date"].min().strftime("%Y%m%d")
-                end_date = group["Date"].max().strftime("%Y%m%d")
-                filename = f"{start_date}_{end_date}.csv"
-
-                # Сохраняем файл
-                group.to_csv(filename, index=False)
-                print(f"✓ Создан {filename} - {len(group)} записей")
+        # Границы годов находятся за один проход, файлы пишутся параллельно
+        for entry in write_partitions(df, ".", "years"):
+            print(f"✓ Создан {entry['file']} - {entry['rows']} записей")
 
         print("✓ Все файлы по годам созданы")
 
@@ -69,34 +59,18 @@ def split_by_weeks():
 
     try:
         # Загружаем данные
-        df = pd.read_csv("dataset.csv")
-        df["Date"] = pd.to_datetime(df["Date"])
+        df = load_dataset("dataset.csv")
 
         print(" dataset.csv успешно загружен")
         print(f"Диапазон дат: от {df['Date'].min()} до {df['Date'].max()}")
 
         print("Разделение по неделям:")
 
-        # Создаем идентификатор недели (год-неделя)
-        df["YearWeek"] = (
-            df["Date"].dt.isocalendar().year.astype(str)
-            + "-"
-            + df["Date"].dt.isocalendar().week.astype(str).str.zfill(2)
-        )
-
-        # Группируем по неделям
-        created_files = 0
-        for week, group in df.groupby("YearWeek"):
-            if not group.empty:
-                # Форматируем даты для названия файла
-                start_date = group["Date"].min().strftime("%Y%m%d")
-                end_date = group["Date"].max().strftime("%Y%m%d")
-                filename = f"{start_date}_{end_date}.csv"
-
-                # Сохраняем файл
-                group[["Date", "INR_Rate"]].to_csv(filename, index=False)
-                print(f"✓ {filename} - {len(group)} записей")
-                created_files += 1
+        # Группы по ISO-неделям, как у isocalendar()
+        entries = write_partitions(df, ".", "weeks", columns=["Date", "INR_Rate"])
+        for entry in entries:
+            print(f"✓ {entry['file']} - {entry['rows']} записей")
+        created_files = len(entries)
 
         print(f"✓ Создано {created_files} файлов по неделям")
 
@@ -110,8 +84,7 @@ class DataIterator:
     def __init__(self, filename: str = "dataset.csv"):
         try:
             # Загружаем и сортируем данные по дате
-            self.df = pd.read_csv(filename)
-            self.df["Date"] = pd.to_datetime(self.df["Date"])
+            self.df = load_dataset(filename)
             self.df = self.df.sort_values("Date").reset_index(drop=True)
             self.current_index = 0
             print(f"Итератор инициализирован. Всего записей: {len(self.df)}")
@@ -173,22 +146,55 @@ def demonstrate_iterator():
             print(f"{i+1:2d}. {date.strftime('%Y-%m-%d')} - {rate:.4f} RUB")
 
 
+# Открытые для поиска файлы: {путь: ((размер, mtime), функция поиска)}
+_single_file_lookups = {}
+
+
+def _single_file_lookup(filename: str):
+    """Функция поиска курса INR по файлу, одна на версию файла
+
+    Если бинарная копия уже есть, курсы читаются из нее через RateStore;
+    иначе CSV разбирается в память без записи копии на диск.
+    """
+    stat = os.stat(filename)
+    stamp = (stat.st_size, stat.st_mtime_ns)
+    key = os.path.abspath(filename)
+    cached = _single_file_lookups.get(key)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    try:
+        store = RateStore(filename, create=False)
+
+        def lookup(date):
+            return store.lookup(date, "INR")
+
+    except ValueError:
+        df = read_rates_csv(filename, usecols=["Date", "INR_Rate"])
+        index = DateIndex(df["Date"])
+        rates = df["INR_Rate"].to_numpy(dtype=float)
+
+        def lookup(date):
+            position = index.position(date)
+            if position is None or pd.isna(rates[position]):
+                return None
+            return float(rates[position])
+
+    _single_file_lookups[key] = (stamp, lookup)
+    return lookup
+
+
 def get_data_single_file(date: datetime, filename: str = "dataset.csv"):
     try:
-        df = pd.read_csv(filename)
-        df["Date"] = pd.to_datetime(df["Date"])
-        mask = df["Date"] == date
-        result_df = df[mask]
-        return result_df["INR_Rate"].iloc[0] if not result_df.empty else None
+        return _single_file_lookup(filename)(date)
     except Exception:
         return None
 
 
 def get_data_xy_files(date: datetime):
     try:
-        dates_df = pd.read_csv("X.csv")
-        data_df = pd.read_csv("Y.csv")
-        dates_df["Date"] = pd.to_datetime(dates_df["Date"])
+        dates_df = read_rates_csv("X.csv", usecols=["Date"])
+        data_df = read_rates_csv("Y.csv", usecols=["INR_Rate"], require_date=False)
         mask = dates_df["Date"] == date
         if mask.any():
             idx = mask.idxmax()
@@ -198,46 +204,44 @@ def get_data_xy_files(date: datetime):
         return None
 
 
+def _search_partitions(files, date: datetime):
+    for file in files:
+        df = read_rates_csv(file, usecols=["Date", "INR_Rate"])
+        result_df = df[df["Date"] == date]
+        if not result_df.empty:
+            return result_df["INR_Rate"].iloc[0]
+    return None
+
+
 def get_data_year_files(date: datetime):
     try:
         year = date.year
-        pattern = f"{year}0101_{year}1231.csv"
-        if os.path.exists(pattern):
-            df = pd.read_csv(pattern)
-            df["Date"] = pd.to_datetime(df["Date"])
-            mask = df["Date"] == date
-            result_df = df[mask]
-            if not result_df.empty:
-                return result_df["INR_Rate"].iloc[0]
-
         files = glob.glob(f"{year}*.csv")
-        for file in files:
-            if any(excluded in file for excluded in ["X.csv", "Y.csv", "dataset.csv"]):
-                continue
-            df = pd.read_csv(file)
-            df["Date"] = pd.to_datetime(df["Date"])
-            mask = df["Date"] == date
-            result_df = df[mask]
-            if not result_df.empty:
-                return result_df["INR_Rate"].iloc[0]
-        return None
+        candidates = [
+            file
+            for file in files
+            if not any(
+                excluded in file for excluded in ["X.csv", "Y.csv", "dataset.csv"]
+            )
+        ]
+        # Файл за полный год проверяется первым
+        pattern = f"{year}0101_{year}1231.csv"
+        if pattern in candidates:
+            candidates.remove(pattern)
+            candidates.insert(0, pattern)
+        return _search_partitions(files_for_date(".", "years", date, candidates), date)
     except Exception:
         return None
 
 
 def get_data_week_files(date: datetime):
     try:
-        files = glob.glob("*_*.csv")
-        for file in files:
-            if file in ["X.csv", "Y.csv", "dataset.csv"]:
-                continue
-            df = pd.read_csv(file)
-            df["Date"] = pd.to_datetime(df["Date"])
-            mask = df["Date"] == date
-            result_df = df[mask]
-            if not result_df.empty:
-                return result_df["INR_Rate"].iloc[0]
-        return None
+        candidates = [
+            file
+            for file in glob.glob("*_*.csv")
+            if file not in ["X.csv", "Y.csv", "dataset.csv"]
+        ]
+        return _search_partitions(files_for_date(".", "weeks", date, candidates), date)
     except Exception:
         return None
 
@@ -267,23 +271,11 @@ def demonstrate_all_versions():
         print(f"Версия 3: {result3}")
 
 
-def get_inr_rate(self, date_str):
+def get_inr_rate(date_str):
     """Получить курс INR с ЦБ РФ и привести к стандарту 1 INR = X RUB"""
-    url = f"https://www.cbr-xml-daily.ru/archive/{date_str}/daily_json.js"
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-    }
     try:
-        response = requests.get(url, headers=headers, timeout=10)
-        if response.status_code == 200:
-            data = response.json()
-            nominal = data["Valute"]["INR"]["Nominal"]  # получаем номинал (1, 10, 100)
-            value = data["Valute"]["INR"]["Value"]  # получаем значение
-            # Приводим к стоимости 1 INR
-            rate_per_one = value / nominal
-            return rate_per_one
-        else:
-            return None
+        payload = default_client.get_daily(date_str)
+        return parse_rate(payload, "INR") if payload is not None else None
     except Exception:
         return None
 
@@ -317,6 +309,8 @@ def kurs():
         else:
             print(f"--- {date_str}: данные не найдены")
 
+    default_client.flush()
+
     with open("dataset.csv", "w", newline="", encoding="utf-8") as csvfile:
         writer = csv.writer(csvfile)
         writer.writerow(["Date", "INR_Rate"])  # ← Изменили заголовок
@@ -1,11 +1,11 @@
 import sys
 import os
+import threading
 from datetime import datetime
-import glob
-import pandas as pd
 from PySide6.QtWidgets import QComboBox
 from PySide6.QtWidgets import (
     QApplication,
+    QCheckBox,
     QMainWindow,
     QWidget,
     QVBoxLayout,
@@ -22,17 +22,57 @@ from PySide6.QtWidgets import (
     QScrollArea,
     QTabWidget,
 )
-from PySide6.QtCore import Qt, QDate
+from PySide6.QtCore import Qt, QDate, QObject, QThread, Signal
 from PySide6.QtGui import QFont
 
 from data_processor import data_processor
 from data_analysis import DataAnalyzer
+from dataset_io import find_csv
+from partitions import files_for_date, partition_cache, partition_files
+
+
+class DownloadWorker(QObject):
+    """Фоновая загрузка данных с ЦБ РФ с прогрессом и отменой"""
+
+    progress = Signal(object)
+    finished = Signal(object)
+
+    def __init__(self, start_date=None, end_date=None, retry_failed=False):
+        super().__init__()
+        self.start_date = start_date
+        self.end_date = end_date
+        self.retry_failed = retry_failed
+        self.cancel_event = threading.Event()
+
+    def run(self):
+        if self.retry_failed:
+            # Повторно запрашиваются только даты из очереди ошибок
+            result = data_processor.retry_failed(
+                progress_callback=self.progress.emit,
+                cancel_event=self.cancel_event,
+            )
+            self.finished.emit(result)
+            return
+        # Период сливается с уже загруженными данными, а не заменяет их
+        result = data_processor.download_new_data(
+            self.start_date,
+            self.end_date,
+            mode="merge",
+            progress_callback=self.progress.emit,
+            cancel_event=self.cancel_event,
+        )
+        self.finished.emit(result)
+
+    def cancel(self):
+        self.cancel_event.set()
 
 
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
         self.analyzer = None
+        self.download_thread = None
+        self.download_worker = None
         self.initUI()
 
     def initUI(self):
@@ -111,6 +151,11 @@ class MainWindow(QMainWindow):
 
         search_layout.addLayout(date_layout)
 
+        self.as_of_checkbox = QCheckBox(
+            "Последний опубликованный курс на дату (выходные и праздники)"
+        )
+        search_layout.addWidget(self.as_of_checkbox)
+
         self.result_label = QLabel("Результат: -")
         self.result_label.setStyleSheet(
             "font-weight: bold; font-size: 14px; color: #2E8B57; padding: 10px;"
@@ -194,6 +239,10 @@ class MainWindow(QMainWindow):
         self.download_btn.clicked.connect(self.download_new_data)
         download_layout.addWidget(self.download_btn)
 
+        self.retry_failed_btn = QPushButton("Догрузить даты с ошибками сети")
+        self.retry_failed_btn.clicked.connect(self.retry_failed_dates)
+        download_layout.addWidget(self.retry_failed_btn)
+
         download_group.setLayout(download_layout)
         scroll_layout.addWidget(download_group)
 
@@ -212,6 +261,20 @@ class MainWindow(QMainWindow):
 
         download_layout.addLayout(download_dates_layout)
 
+        progress_layout = QHBoxLayout()
+        self.download_progress = QProgressBar()
+        self.download_progress.setValue(0)
+        progress_layout.addWidget(self.download_progress, 4)
+
+        self.cancel_download_btn = QPushButton("Отменить")
+        self.cancel_download_btn.setEnabled(False)
+        self.cancel_download_btn.clicked.connect(self.cancel_download)
+        progress_layout.addWidget(self.cancel_download_btn, 1)
+        download_layout.addLayout(progress_layout)
+
+        self.download_status = QLabel("")
+        download_layout.addWidget(self.download_status)
+
         # 6. Лог действий
         log_group = QGroupBox("Лог действий")
         log_layout = QVBoxLayout()
@@ -375,9 +438,12 @@ class MainWindow(QMainWindow):
     def _get_data_xy_files(self, date: datetime):
         """Версия 1: поиск в раздельных файлах"""
         try:
-            dates_df = pd.read_csv(os.path.join(data_processor.dataset_path, "X.csv"))
-            data_df = pd.read_csv(os.path.join(data_processor.dataset_path, "Y.csv"))
-            dates_df["Date"] = pd.to_datetime(dates_df["Date"])
+            folder = data_processor.dataset_path
+            # Повторный поиск берет разобранные файлы из кэша, а не с диска
+            dates_df = partition_cache.read(find_csv(folder, "X.csv"), usecols=["Date"])
+            data_df = partition_cache.read(
+                find_csv(folder, "Y.csv"), usecols=["INR_Rate"], require_date=False
+            )
             mask = dates_df["Date"] == date
             if mask.any():
                 idx = mask.idxmax()
@@ -389,46 +455,37 @@ class MainWindow(QMainWindow):
     def _get_data_year_files(self, date: datetime):
         """Версия 2: поиск в файлах по годам"""
         try:
-            year = date.year
-            files = glob.glob(os.path.join(data_processor.dataset_path, f"{year}*.csv"))
-            for file in files:
-                if any(
-                    excluded in file for excluded in ["X.csv", "Y.csv", "dataset.csv"]
-                ):
-                    continue
-                df = pd.read_csv(file)
-                df["Date"] = pd.to_datetime(df["Date"])
-                mask = df["Date"] == date
-                result_df = df[mask]
-                if not result_df.empty:
-                    return result_df["INR_Rate"].iloc[0]
-            return None
+            folder = data_processor.dataset_path
+            # Список файлов нужен, только если манифест не подходит
+            return self._search_partitions(
+                files_for_date(folder, "years", date, prefix=str(date.year)), date
+            )
         except Exception:
             return None
 
     def _get_data_week_files(self, date: datetime):
         """Версия 3: поиск в файлах по неделям"""
         try:
-            files = glob.glob(os.path.join(data_processor.dataset_path, "*_*.csv"))
-            for file in files:
-                if any(
-                    excluded in file for excluded in ["X.csv", "Y.csv", "dataset.csv"]
-                ):
-                    continue
-                df = pd.read_csv(file)
-                df["Date"] = pd.to_datetime(df["Date"])
-                mask = df["Date"] == date
-                result_df = df[mask]
-                if not result_df.empty:
-                    return result_df["INR_Rate"].iloc[0]
-            return None
+            folder = data_processor.dataset_path
+            return self._search_partitions(files_for_date(folder, "weeks", date), date)
         except Exception:
             return None
 
+    def _search_partitions(self, files, date: datetime):
+        """Курс за дату из первого файла разбиения, где она есть"""
+        for file in files:
+            df = partition_cache.read(file, usecols=["Date", "INR_Rate"])
+            result_df = df[df["Date"] == date]
+            if not result_df.empty:
+                return result_df["INR_Rate"].iloc[0]
+        return None
+
     # === МЕТОДЫ ОСНОВНОГО ФУНКЦИОНАЛА ===
 
     def select_folder(self):
         """Выбор папки с данными"""
+        if self.download_worker is not None:
+            return
         folderpath = QFileDialog.getExistingDirectory(self, "Выберите папку с данными")
         if folderpath:
             self.folder_path_label.setText(folderpath)
@@ -462,7 +519,14 @@ class MainWindow(QMainWindow):
         version_name = ""
 
         # Выбор версии поиска
-        if version_index == 0:  # Единый файл
+        if self.as_of_checkbox.isChecked():
+            # Бинарный поиск по датам загруженного датасета
+            found = data_processor.get_data_as_of(selected_date)
+            version_name = "последний опубликованный"
+            if found is not None:
+                rate, effective_date = found
+                version_name += f" на {effective_date.strftime('%Y-%m-%d')}"
+        elif version_index == 0:  # Единый файл
             rate = data_processor.get_data_by_date(selected_date)
             version_name = "единый файл"
         elif version_index == 1:  # X/Y файлы
@@ -553,19 +617,10 @@ class MainWindow(QMainWindow):
             data_type = "original"
             dataset_path = data_processor.dataset_path
 
-            if os.path.exists(os.path.join(dataset_path, "X.csv")):
+            if find_csv(dataset_path, "X.csv") is not None:
                 data_type = "xy"
-            elif any(
-                f.endswith(".csv") and f not in ["X.csv", "Y.csv", "dataset.csv"]
-                for f in os.listdir(dataset_path)
-            ):
-                csv_files = [
-                    f
-                    for f in os.listdir(dataset_path)
-                    if f.endswith(".csv") and f not in ["X.csv", "Y.csv", "dataset.csv"]
-                ]
-                if csv_files:
-                    data_type = "years"
+            elif partition_files(dataset_path):
+                data_type = "years"
 
             result = data_processor.create_annotation(filepath, data_type)
             if "error" in result:
@@ -598,15 +653,86 @@ class MainWindow(QMainWindow):
             self.log_message(
                 f" Загрузка данных с {start_date.strftime('%Y-%m-%d')} по {end_date.strftime('%Y-%m-%d')}..."
             )
-            result = data_processor.download_new_data(start_date, end_date)
+            self.start_download(start_date, end_date)
+
+    def retry_failed_dates(self):
+        """Повторная загрузка дат, которые не удалось скачать из-за сети"""
+        failed_dates = data_processor.get_failed_dates()
+        if not failed_dates:
+            QMessageBox.information(
+                self, "Информация", "Нет дат для повторной загрузки"
+            )
+            return
+        self.log_message(f" Повторная загрузка {len(failed_dates)} дат...")
+        self.start_download(retry_failed=True)
+
+    def start_download(self, start_date=None, end_date=None, retry_failed=False):
+        """Запуск загрузки в фоновом потоке, чтобы окно не зависало"""
+        self.download_thread = QThread(self)
+        self.download_worker = DownloadWorker(start_date, end_date, retry_failed)
+        self.download_worker.moveToThread(self.download_thread)
+
+        self.download_thread.started.connect(self.download_worker.run)
+        self.download_worker.progress.connect(self.on_download_progress)
+        self.download_worker.finished.connect(self.on_download_finished)
+        self.download_worker.finished.connect(self.download_thread.quit)
+        self.download_thread.finished.connect(self.download_worker.deleteLater)
+        self.download_thread.finished.connect(self.download_thread.deleteLater)
+
+        self.download_progress.setValue(0)
+        self.download_status.setText("Загрузка...")
+        # Пока идет загрузка, папку датасета менять нельзя: загрузчик в конце
+        # записывает датасет и очередь ошибок в data_processor.dataset_path
+        self.update_buttons_state()
+        self.cancel_download_btn.setEnabled(True)
+        self.download_thread.start()
+
+    def cancel_download(self):
+        """Отмена фоновой загрузки (загруженное до отмены сливается с датасетом)"""
+        if self.download_worker is not None:
+            self.download_worker.cancel()
+            self.cancel_download_btn.setEnabled(False)
+            self.download_status.setText("Отмена загрузки...")
+
+    def on_download_progress(self, progress):
+        """Обновление прогресса загрузки"""
+        self.download_progress.setMaximum(progress["total"])
+        self.download_progress.setValue(progress["done"])
+        eta = progress["eta_seconds"]
+        eta_text = f", осталось ~{eta:.0f} с" if eta is not None else ""
+        self.download_status.setText(
+            f"{progress['done']} из {progress['total']} дат, "
+            f"{progress['dates_per_second']:.1f} дат/с{eta_text}"
+        )
 
-            if "error" in result:
-                QMessageBox.critical(self, "Ошибка", result["error"])
-                self.log_message(f" {result['error']}")
+    def on_download_finished(self, result):
+        """Завершение фоновой загрузки"""
+        self.download_worker = None
+        self.download_thread = None
+        self.cancel_download_btn.setEnabled(False)
+
+        if "error" in result:
+            self.download_status.setText("Ошибка загрузки")
+            QMessageBox.critical(self, "Ошибка", result["error"])
+            self.log_message(f" {result['error']}")
+        else:
+            self.download_status.setText(result["message"])
+            if result.get("cancelled"):
+                QMessageBox.information(self, "Отменено", result["message"])
             else:
                 QMessageBox.information(self, "Успех", result["message"])
-                self.log_message(f" {result['message']}")
-                self.update_buttons_state()
+            self.log_message(f" {result['message']}")
+            if data_processor.current_dataset is not None:
+                self.initialize_analyzer()
+        self.update_buttons_state()
+
+    def closeEvent(self, event):
+        """Остановить фоновую загрузку перед закрытием окна"""
+        if self.download_worker is not None:
+            self.download_worker.cancel()
+            self.download_thread.quit()
+            self.download_thread.wait()
+        super().closeEvent(event)
 
     def demo_search_versions_ui(self):
         """Демонстрация 4 версий поиска через интерфейс"""
@@ -633,6 +759,11 @@ class MainWindow(QMainWindow):
         result3 = self._get_data_week_files(selected_date)
         results.append(f"Версия 3: {result3}")
 
+        cache = partition_cache.stats()
+        results.append(
+            f"Кэш файлов: попаданий {cache['hits']}, промахов {cache['misses']}"
+        )
+
         # Показываем результаты
         message = (
             f"Результаты поиска для {selected_date.strftime('%Y-%m-%d')}:\n"
@@ -805,7 +936,11 @@ class MainWindow(QMainWindow):
         self.split_years_btn.setEnabled(has_data)
         self.split_weeks_btn.setEnabled(has_data)
         self.create_reorg_annotation_btn.setEnabled(has_data)
-        self.download_btn.setEnabled(has_folder)
+        self.select_folder_btn.setEnabled(self.download_worker is None)
+        self.download_btn.setEnabled(has_folder and self.download_worker is None)
+        self.retry_failed_btn.setEnabled(
+            self.download_btn.isEnabled() and bool(data_processor.get_failed_dates())
+        )
 
         # Обновляем состояние кнопок анализа
         self.update_analysis_buttons(has_data)
@@ -0,0 +1,379 @@
+import bisect
+import json
+import os
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from dataset_io import COMPRESSION_EXTENSIONS, csv_name, open_file, read_rates_csv
+
+# Манифест разбиений лежит в папке с файлами по годам/неделям
+MANIFEST_NAME = "partitions.json"
+MANIFEST_VERSION = 1
+PARTITION_LAYOUTS = ("years", "weeks")
+DEFAULT_WRITE_WORKERS = 4
+# Ограничения кэша разобранных файлов: число файлов и память под фреймы
+DEFAULT_CACHE_ENTRIES = 256
+DEFAULT_CACHE_BYTES = 64 * 2**20
+
+# Файлы разбиения по годам/неделям: YYYYMMDD_YYYYMMDD.csv[.gz|.bz2|.xz]
+PARTITION_FILE_RE = re.compile(
+    r"^\d{8}_\d{8}\.csv(%s)?$"
+    % "|".join(re.escape(ext) for ext in COMPRESSION_EXTENSIONS.values())
+)
+
+# Разобранные манифесты и списки файлов разбиения по папкам:
+# {путь: ((mtime_ns, size), значение)}
+_manifests: Dict[str, Tuple[Tuple[int, int], Dict]] = {}
+_listings: Dict[str, Tuple[Tuple[int, int], List[str]]] = {}
+_folder_lock = threading.Lock()
+
+
+def _stamp(path: str) -> Tuple[int, int]:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _cached(cache: Dict, path: str, load: Callable):
+    """load(path) из cache, пока время изменения и размер path те же"""
+    stamp = _stamp(path)
+    key = os.path.abspath(path)
+    with _folder_lock:
+        cached = cache.get(key)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    value = load(path)
+    with _folder_lock:
+        cache[key] = (stamp, value)
+    return value
+
+
+def _load_json(path: str) -> Dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _list_partitions(folder: str) -> List[str]:
+    return sorted(f for f in os.listdir(folder) if PARTITION_FILE_RE.match(f))
+
+
+def partition_files(folder: str, prefix: str = "") -> List[str]:
+    """Пути файлов разбиения в папке (сжатых или нет), начинающихся с prefix
+
+    Список файлов папки читается заново, только если папка изменилась.
+    """
+    names = _cached(_listings, folder, _list_partitions)
+    return [os.path.join(folder, f) for f in names if f.startswith(prefix)]
+
+
+def partition_entry(
+    filename: str, dates: np.ndarray, size: int, checksum: Optional[int] = None
+) -> Dict:
+    """Описание записанного файла разбиения для манифеста"""
+    return {
+        "file": filename,
+        "start": pd.Timestamp(np.min(dates)).strftime("%Y-%m-%d"),
+        "end": pd.Timestamp(np.max(dates)).strftime("%Y-%m-%d"),
+        "rows": int(len(dates)),
+        "bytes": size,
+        "crc32": checksum,
+    }
+
+
+def read_manifest(folder: str) -> Dict[str, List[Dict]]:
+    """Разделы манифеста {layout: [записи]} или {}, если манифеста нет
+
+    Разобранный манифест кэшируется, пока файл не изменился; записи
+    общие для всех вызовов, менять их нельзя.
+    """
+    try:
+        manifest = _cached(_manifests, os.path.join(folder, MANIFEST_NAME), _load_json)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {}
+    return dict(manifest.get("layouts", {}))
+
+
+def write_manifest(folder: str, layout: str, entries: Sequence[Dict]):
+    """Записать раздел манифеста для layout, сохранив остальные разделы"""
+    layouts = read_manifest(folder)
+    layouts[layout] = sorted(entries, key=lambda entry: entry["start"])
+    manifest = {"version": MANIFEST_VERSION, "layouts": layouts}
+    path = os.path.join(folder, MANIFEST_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, path)
+    # Записанный манифест сразу попадает в кэш, без повторного разбора
+    with _folder_lock:
+        _manifests[os.path.abspath(path)] = (_stamp(path), manifest)
+
+
+def manifest_entries(folder: str, layout: str) -> Optional[List[Dict]]:
+    """Записи манифеста для layout или None, если раздела нет"""
+    return read_manifest(folder).get(layout)
+
+
+def find_entry(entries: Sequence[Dict], date: datetime) -> Optional[Dict]:
+    """Запись, диапазон которой содержит дату (записи отсортированы по start)"""
+    day = pd.Timestamp(date).strftime("%Y-%m-%d")
+    starts = [entry["start"] for entry in entries]
+    i = bisect.bisect_right(starts, day) - 1
+    if i >= 0 and day <= entries[i]["end"]:
+        return entries[i]
+    return None
+
+
+def files_for_date(
+    folder: str,
+    layout: str,
+    date: datetime,
+    candidates: Optional[Sequence[str]] = None,
+    prefix: str = "",
+) -> List[str]:
+    """Файлы, которые нужно открыть, чтобы найти дату
+
+    По манифесту - не более одного файла (или ни одного, если дата вне
+    всех диапазонов). Если манифеста нет или найденный файл изменился
+    после его записи, возвращаются все candidates, как при переборе;
+    без candidates - файлы разбиения папки, начинающиеся с prefix.
+    """
+    entries = manifest_entries(folder, layout)
+    if entries is not None:
+        entry = find_entry(entries, date)
+        if entry is None:
+            return []
+        path = os.path.join(folder, entry["file"])
+        try:
+            if os.path.getsize(path) == entry["bytes"]:
+                return [path]
+        except OSError:
+            pass
+    if candidates is None:
+        return partition_files(folder, prefix)
+    return list(candidates)
+
+
+def partition_keys(days: np.ndarray, layout: str) -> np.ndarray:
+    """Ключ разбиения для каждой даты (datetime64[D]): год или ISO-неделя
+
+    Ключ недели - ISO-год * 100 + номер недели, как у isocalendar().
+    """
+    if layout == "years":
+        return days.astype("datetime64[Y]").astype(np.int64) + 1970
+    if layout == "weeks":
+        # 1970-01-01 - четверг; ISO-неделя принадлежит году своего четверга
+        weekday = (days.astype(np.int64) + 3) % 7
+        thursday = days - weekday + 3
+        iso_year = thursday.astype("datetime64[Y]")
+        week = (thursday - iso_year.astype("datetime64[D]")).astype(np.int64) // 7 + 1
+        return (iso_year.astype(np.int64) + 1970) * 100 + week
+    raise ValueError(f"Неизвестное разбиение: {layout}")
+
+
+def plan_partitions(
+    days: np.ndarray, layout: str
+) -> Tuple[Optional[np.ndarray], List[Tuple[int, int]]]:
+    """Границы групп [start, stop) за один проход по массиву дат
+
+    Если ключи уже идут по возрастанию (датасет отсортирован), порядок
+    строк не меняется и первым значением возвращается None. Иначе
+    возвращается устойчивая перестановка: строки внутри группы остаются
+    в исходном порядке, как при groupby.
+    """
+    keys = partition_keys(days, layout)
+    order = None
+    if len(keys) > 1 and (np.diff(keys) < 0).any():
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+    if not len(keys):
+        return order, []
+    breaks = (np.flatnonzero(np.diff(keys)) + 1).tolist()
+    return order, list(zip([0] + breaks, breaks + [len(keys)]))
+
+
+def _write_text(path: str, chunks: Sequence[str]) -> Tuple[int, int]:
+    """Записать текст и вернуть размер файла в байтах и CRC32 текста"""
+    data = "".join(chunks).encode("utf-8")
+    with open_file(path, "wb") as f:
+        f.write(data)
+    return os.path.getsize(path), zlib.crc32(data)
+
+
+def _write_frames(jobs: Sequence[Tuple[str, pd.DataFrame]], max_workers: int):
+    """Записать фреймы в CSV параллельно из пула потоков"""
+    if max_workers < 1:
+        raise ValueError("max_workers должен быть >= 1")
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(frame.to_csv, path, index=False) for path, frame in jobs
+        ]
+        for future in futures:
+            future.result()
+
+
+def write_partitions(
+    df: pd.DataFrame,
+    folder: str,
+    layout: str,
+    columns: Optional[Sequence[str]] = None,
+    max_workers: int = DEFAULT_WRITE_WORKERS,
+    compression: Optional[str] = None,
+) -> List[Dict]:
+    """Разбить датасет по годам или неделям и записать файлы и манифест
+
+    Файлы называются START_END.csv (START_END.csv.gz и т.п. при сжатии)
+    по первой и последней дате группы. Возвращает записи манифеста в
+    порядке групп.
+    """
+    days = df["Date"].values.astype("datetime64[D]")
+    order, bounds = plan_partitions(days, layout)
+    if order is not None:
+        df = df.take(order)
+        days = days[order]
+    frame = df if columns is None else df[list(columns)]
+
+    # Строки CSV формируются одним вызовом to_csv для всего датасета, а не
+    # сотнями мелких вызовов; файлы получают заголовок и свой срез строк
+    header = frame.iloc[:0].to_csv(index=False)
+    lines = frame.to_csv(index=False, header=False).splitlines(keepends=True)
+
+    if max_workers < 1:
+        raise ValueError("max_workers должен быть >= 1")
+    names = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = []
+        for start, stop in bounds:
+            group_days = days[start:stop]
+            first = np.datetime_as_string(group_days.min()).replace("-", "")
+            last = np.datetime_as_string(group_days.max()).replace("-", "")
+            filename = csv_name(f"{first}_{last}.csv", compression)
+            names.append((filename, group_days))
+            futures.append(
+                executor.submit(
+                    _write_text,
+                    os.path.join(folder, filename),
+                    [header] + lines[start:stop],
+                )
+            )
+        written = [future.result() for future in futures]
+
+    entries = [
+        partition_entry(name, group_days, size, checksum)
+        for (name, group_days), (size, checksum) in zip(names, written)
+    ]
+    write_manifest(folder, layout, entries)
+    return entries
+
+
+def write_columns(
+    df: pd.DataFrame,
+    folder: str,
+    files: Dict[str, Sequence[str]],
+    max_workers: int = DEFAULT_WRITE_WORKERS,
+    compression: Optional[str] = None,
+) -> List[str]:
+    """Записать столбцы датасета в отдельные файлы ({"X.csv": ["Date"], ...})
+
+    Возвращает имена записанных файлов (с расширением сжатия).
+    """
+    names = [csv_name(filename, compression) for filename in files]
+    jobs = [
+        (os.path.join(folder, name), df[list(columns)])
+        for name, columns in zip(names, files.values())
+    ]
+    _write_frames(jobs, max_workers)
+    return names
+
+
+class PartitionCache:
+    """LRU-кэш разобранных CSV-файлов разбиения (X/Y, годы, недели)
+
+    Ключ - путь и набор столбцов. При каждом обращении сверяются время
+    изменения и размер файла (os.stat), поэтому переписанный файл
+    читается заново, а неизмененный не читается с диска. Когда число
+    файлов или память под фреймы превышает предел, вытесняются давно не
+    использованные. Возвращаемые фреймы общие: менять их нельзя.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_CACHE_ENTRIES,
+        max_bytes: int = DEFAULT_CACHE_BYTES,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._frames = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    def read(
+        self,
+        path: str,
+        usecols: Optional[Sequence[str]] = None,
+        require_date: bool = True,
+    ) -> pd.DataFrame:
+        """Фрейм файла из кэша или read_rates_csv при промахе"""
+        stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        key = (
+            os.path.abspath(path),
+            tuple(usecols) if usecols is not None else None,
+            require_date,
+        )
+        with self._lock:
+            cached = self._frames.get(key)
+            if cached is not None and cached[0] == stamp:
+                self._frames.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+
+        df = read_rates_csv(path, usecols=usecols, require_date=require_date)
+        size = int(df.memory_usage(index=True).sum())
+        with self._lock:
+            old = self._frames.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._frames[key] = (stamp, df, size)
+            self._bytes += size
+            while len(self._frames) > self.max_entries or (
+                self._bytes > self.max_bytes and len(self._frames) > 1
+            ):
+                _, (_, _, evicted) = self._frames.popitem(last=False)
+                self._bytes -= evicted
+        return df
+
+    def clear(self):
+        """Очистить кэш и счетчики"""
+        with self._lock:
+            self._frames.clear()
+            self._bytes = 0
+            self.hits = self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Попадания, промахи, число файлов и память под фреймы"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._frames),
+                "bytes": self._bytes,
+            }
+
+
+# Общий кэш для поиска из GUI и DataProcessor.get_data_by_dates
+partition_cache = PartitionCache()
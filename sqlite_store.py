@@ -0,0 +1,152 @@
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Iterable, List, Optional, Sequence
+
+import pandas as pd
+
+from dataset_io import DATE_DTYPE
+
+# Файл базы в папке датасета
+SQLITE_NAME = "dataset.sqlite"
+# Сколько ждать (в секундах), пока другой процесс или поток держит запись
+SQLITE_TIMEOUT = 30.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rates (
+    date TEXT NOT NULL,
+    code TEXT NOT NULL,
+    value REAL,
+    PRIMARY KEY (date, code)
+) WITHOUT ROWID
+"""
+
+UPSERT = """
+INSERT INTO rates (date, code, value) VALUES (?, ?, ?)
+ON CONFLICT (date, code) DO UPDATE SET value = excluded.value
+"""
+
+
+def _day(date) -> str:
+    return pd.Timestamp(date).strftime("%Y-%m-%d")
+
+
+class SQLiteRateStore:
+    """Курсы валют в SQLite: одна строка на дату и валюту
+
+    Первичный ключ (date, code) служит индексом для поиска по дате и
+    диапазону дат. База открыта в режиме WAL, и у каждого потока свое
+    соединение: поиск из GUI читает данные, пока фоновая загрузка пишет.
+    """
+
+    def __init__(self, path: str, timeout: float = SQLITE_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        """Закрыть соединение текущего потока"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def upsert_rows(self, rows: Iterable[Sequence], codes: Sequence[str]) -> int:
+        """Записать строки [дата, курс1, курс2, ...] одной транзакцией
+
+        Существующие курсы за те же даты заменяются. Пустые значения
+        (валюта не опубликована) не записываются. Возвращает число строк.
+        """
+        params = []
+        count = 0
+        for row in rows:
+            count += 1
+            day = _day(row[0])
+            for code, value in zip(codes, row[1:]):
+                if value != "" and not pd.isna(value):
+                    params.append((day, code, float(value)))
+        with self._connection() as conn:
+            conn.executemany(UPSERT, params)
+        return count
+
+    def import_dataframe(self, df: pd.DataFrame) -> int:
+        """Записать датасет в формате CSV (Date и столбцы <КОД>_Rate)"""
+        columns = [col for col in df.columns if col.endswith("_Rate")]
+        codes = [col[: -len("_Rate")] for col in columns]
+        rows = df[["Date"] + columns].itertuples(index=False, name=None)
+        return self.upsert_rows(rows, codes)
+
+    def get_rate(self, date: datetime, code: str = "INR") -> Optional[float]:
+        """Курс за дату по индексу или None"""
+        row = (
+            self._connection()
+            .execute(
+                "SELECT value FROM rates WHERE date = ? AND code = ?",
+                (_day(date), code),
+            )
+            .fetchone()
+        )
+        return row[0] if row is not None else None
+
+    def currencies(self) -> List[str]:
+        """Коды валют в базе"""
+        rows = self._connection().execute("SELECT DISTINCT code FROM rates")
+        return sorted(code for (code,) in rows)
+
+    def last_date(self) -> Optional[datetime]:
+        """Последняя дата в базе"""
+        row = self._connection().execute("SELECT MAX(date) FROM rates").fetchone()
+        return datetime.strptime(row[0], "%Y-%m-%d") if row[0] else None
+
+    def count_dates(self) -> int:
+        """Число дат в базе"""
+        row = (
+            self._connection()
+            .execute("SELECT COUNT(DISTINCT date) FROM rates")
+            .fetchone()
+        )
+        return row[0]
+
+    def get_range(
+        self,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        codes: Optional[Sequence[str]] = None,
+    ) -> pd.DataFrame:
+        """Курсы за период в формате датасета: Date и столбцы <КОД>_Rate"""
+        query = "SELECT date, code, value FROM rates WHERE date >= ? AND date <= ?"
+        params = [
+            _day(start_date) if start_date is not None else "0000-00-00",
+            _day(end_date) if end_date is not None else "9999-99-99",
+        ]
+        if codes:
+            query += f" AND code IN ({', '.join('?' * len(codes))})"
+            params.extend(codes)
+        long = pd.read_sql_query(
+            query + " ORDER BY date", self._connection(), params=params
+        )
+
+        columns = list(codes) if codes else self.currencies()
+        wide = long.pivot(index="date", columns="code", values="value")
+        wide = wide.reindex(columns=columns)
+        wide.columns = [f"{code}_Rate" for code in columns]
+        wide = wide.reset_index(names="Date")
+        wide["Date"] = pd.to_datetime(wide["Date"], format="%Y-%m-%d").astype(
+            DATE_DTYPE
+        )
+        return wide
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """Весь датасет в формате CSV-файла"""
+        return self.get_range()
@@ -0,0 +1,182 @@
+import json
+import os
+import sys
+import time
+from datetime import date
+from unittest import mock
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import requests
+
+from cbr_client import (
+    CBRClient,
+    FetchError,
+    PublicationCalendar,
+    ResponseCache,
+    TokenBucket,
+    parse_rate,
+)
+
+
+def make_payload(inr_value=90.5, nominal=100):
+    return {"Valute": {"INR": {"Nominal": nominal, "Value": inr_value}}}
+
+
+class TestResponseCache:
+
+    @pytest.fixture
+    def cache(self, tmp_path):
+        return ResponseCache(str(tmp_path / "cache"), max_bytes=1024, today_ttl=60)
+
+    def test_put_and_get_past_date(self, cache):
+        cache.put("2020/01/10", '{"a": 1}')
+
+        assert cache.get("2020/01/10") == '{"a": 1}'
+        assert cache.get("2020/01/11") is None
+
+    def test_past_date_never_expires(self, cache):
+        cache.put("2020/01/10", "{}")
+        path = cache._path("2020/01/10")
+        old = time.time() - 10 * 365 * 24 * 3600
+        os.utime(path, (old, old))
+
+        assert cache.get("2020/01/10") == "{}"
+
+    def test_today_expires_after_ttl(self, cache):
+        today = date.today().strftime("%Y/%m/%d")
+        cache.put(today, "{}")
+        assert cache.get(today) == "{}"
+
+        path = cache._path(today)
+        old = time.time() - 120
+        os.utime(path, (old, old))
+        assert cache.get(today) is None
+
+    def test_evicts_least_recently_used(self, cache):
+        body = "x" * 300
+        for day in range(1, 4):
+            cache.put(f"2020/01/0{day}", body)
+            path = cache._path(f"2020/01/0{day}")
+            os.utime(path, (1000 + day, 1000 + day))
+        # Обращение делает 2020-01-01 самым свежим
+        cache.get("2020/01/01")
+        cache.put("2020/01/04", body)
+
+        assert cache.get("2020/01/02") is None
+        assert cache.get("2020/01/01") == body
+        assert cache.get("2020/01/04") == body
+
+
+def make_response(status_code, payload=None):
+    content = json.dumps(payload).encode() if payload is not None else b""
+    return mock.Mock(status_code=status_code, content=content, headers={})
+
+
+class TestPublicationCalendar:
+
+    def test_learns_gap_from_previous_date(self, tmp_path):
+        calendar = PublicationCalendar(str(tmp_path / "calendar.json"))
+        payload = {
+            "Date": "2024-01-16T11:30:00+03:00",
+            "PreviousDate": "2024-01-13T11:30:00+03:00",
+        }
+        calendar.record_payload("2024/01/16", payload)
+        calendar.save()
+
+        reloaded = PublicationCalendar(calendar.path)
+        assert reloaded.is_skipped("2024/01/14")
+        assert reloaded.is_skipped("2024/01/15")
+        assert not reloaded.is_skipped("2024/01/13")
+        assert not reloaded.is_skipped("2024/01/16")
+
+    def test_never_records_today(self, tmp_path):
+        calendar = PublicationCalendar(str(tmp_path / "calendar.json"))
+        today = date.today().strftime("%Y/%m/%d")
+        calendar.record_missing(today)
+        calendar.record_missing("2024/01/14")
+
+        assert not calendar.is_skipped(today)
+        assert calendar.is_skipped("2024/01/14")
+
+
+class TestCBRClient:
+
+    @pytest.fixture
+    def client(self, tmp_path):
+        return CBRClient(
+            cache=ResponseCache(str(tmp_path)), backoff_factor=0, rate_limit=None
+        )
+
+    def test_served_from_cache_without_network(self, client):
+        response = make_response(200, make_payload())
+
+        with mock.patch.object(client.session, "get", return_value=response) as get:
+            first = client.get_daily("2020/01/10")
+            second = client.get_daily("2020/01/10")
+
+        assert first == second == make_payload()
+        assert get.call_count == 1
+        assert client.stats.snapshot()["cache_hits"] == 1
+
+    def test_missing_file_is_not_cached(self, client):
+        with mock.patch.object(
+            client.session, "get", return_value=make_response(404)
+        ) as get:
+            assert client.get_daily("2020/01/11") is None
+            assert client.get_daily("2020/01/11") is None
+
+        assert get.call_count == 2
+        assert client.stats.snapshot()["misses"] == 2
+
+    def test_retries_transient_errors(self, client):
+        responses = [
+            requests.ConnectionError("reset"),
+            make_response(503),
+            make_response(200, make_payload()),
+        ]
+
+        with mock.patch.object(client.session, "get", side_effect=responses):
+            assert client.get_daily("2020/01/10") == make_payload()
+
+        stats = client.stats.snapshot()
+        assert stats["retries"] == 2
+        assert stats["errors"] == 0
+
+    def test_exhausted_retries_raise_fetch_error(self, client):
+        with mock.patch.object(
+            client.session, "get", side_effect=requests.Timeout("slow")
+        ) as get:
+            with pytest.raises(FetchError):
+                client.get_daily("2020/01/10")
+
+        assert get.call_count == client.max_retries + 1
+        assert client.stats.snapshot()["errors"] == 1
+        assert client.stats.snapshot()["misses"] == 0
+
+    def test_skips_known_non_publication_days(self, tmp_path):
+        calendar = PublicationCalendar(str(tmp_path / "calendar.json"))
+        client = CBRClient(calendar=calendar, backoff_factor=0, rate_limit=None)
+
+        with mock.patch.object(
+            client.session, "get", return_value=make_response(404)
+        ) as get:
+            assert client.get_daily("2020/01/11") is None
+            assert client.get_daily("2020/01/11") is None
+
+        assert get.call_count == 1
+        assert client.stats.snapshot()["skipped"] == 1
+
+    def test_token_bucket_limits_rate(self):
+        bucket = TokenBucket(rate=100, capacity=1)
+        started = time.monotonic()
+        for _ in range(6):
+            bucket.acquire()
+
+        assert time.monotonic() - started >= 0.045
+
+    def test_parse_rate_normalizes_nominal(self):
+        assert parse_rate(make_payload(90.5, 100)) == pytest.approx(0.905)
+        assert parse_rate(make_payload(), "USD") is None
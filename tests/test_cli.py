@@ -0,0 +1,74 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import cli
+
+
+class TestCli:
+
+    @pytest.fixture
+    def dataset_folder(self, tmp_path):
+        dates = pd.date_range(start="2019-12-20", end="2020-01-20", freq="D")
+        df = pd.DataFrame({"Date": dates, "INR_Rate": range(len(dates))})
+        df.to_csv(tmp_path / "dataset.csv", index=False)
+        return tmp_path
+
+    def test_pipeline_runs_all_local_stages(self, dataset_folder):
+        output = dataset_folder / "out"
+        exit_code = cli.main(
+            [
+                str(dataset_folder),
+                "split-xy",
+                "split-years",
+                "split-weeks",
+                "stats",
+                "group-by-month",
+                "annotate",
+                "--output",
+                str(output),
+            ]
+        )
+
+        assert exit_code == 0
+        assert (output / "xy" / "X.csv").exists()
+        assert sorted(os.listdir(output / "years")) == [
+            "20191220_20191231.csv",
+            "20200101_20200120.csv",
+            "partitions.json",
+        ]
+        assert len(os.listdir(output / "weeks")) == 6 + 1
+        assert (output / "statistics.csv").exists()
+        assert len(pd.read_csv(output / "monthly.csv")) == 2
+        annotation = (output / "annotation_years.txt").read_text(encoding="utf-8")
+        assert "20200101_20200120.csv: 20 записей" in annotation
+
+    def test_missing_dataset_fails(self, tmp_path):
+        assert cli.main([str(tmp_path), "stats"]) == 1
+
+    def test_compressed_pipeline(self, dataset_folder):
+        output = dataset_folder / "out"
+        exit_code = cli.main(
+            [
+                str(dataset_folder),
+                "split-xy",
+                "split-years",
+                "annotate",
+                "--output",
+                str(output),
+                "--compression",
+                "gzip",
+            ]
+        )
+
+        assert exit_code == 0
+        assert (output / "xy" / "X.csv.gz").exists()
+        assert (output / "years" / "20200101_20200120.csv.gz").exists()
+        annotation = (output / "annotation_years.txt").read_text(encoding="utf-8")
+        assert "20200101_20200120.csv.gz: 20 записей" in annotation
+        xy = (output / "annotation_xy.txt").read_text(encoding="utf-8")
+        assert "X.csv.gz: 32 записей" in xy
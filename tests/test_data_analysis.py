@@ -95,6 +95,25 @@ class TestDataAnalyzer:
         assert filtered["date"].min() >= pd.to_datetime(start_date)
         assert filtered["date"].max() <= pd.to_datetime(end_date)
 
+    def test_filter_by_date_range_returns_slice_or_copy(self, analyzer):
+        view = analyzer.filter_by_date_range("2020-01-03", "2020-01-04", copy=False)
+        copied = analyzer.filter_by_date_range("2020-01-03", "2020-01-04")
+
+        assert view["inr_rate"].tolist() == pytest.approx([1.2, 1.3])
+        pd.testing.assert_frame_equal(view, copied)
+        copied["inr_rate"] = 0.0
+        assert analyzer.df["inr_rate"].iloc[2] == pytest.approx(1.2)
+
+    def test_filter_by_date_range_unsorted_dates(self, processor_with_data):
+        shuffled = processor_with_data.current_dataset.iloc[[5, 1, 9, 2, 0]]
+        processor_with_data.current_dataset = shuffled.reset_index(drop=True)
+        analyzer = DataAnalyzer(processor_with_data)
+
+        filtered = analyzer.filter_by_date_range("2020-01-02", "2020-01-06")
+
+        assert filtered["date"].dt.day.tolist() == [6, 2, 3]
+        assert analyzer.filter_by_date_range("2020-02-01", "2020-01-01").empty
+
     def test_filter_by_date_range_invalid_dates(self, analyzer):
         filtered = analyzer.filter_by_date_range("invalid-date", "2020-01-01")
 
@@ -1,13 +1,41 @@
 import unittest
 import pandas as pd
 from datetime import datetime
+import json
 import os
 import sys
+import threading
+import time
+from unittest import mock
 
 # Добавляем путь к корневой папке проекта
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from cbr_client import FetchError
 from data_processor import DataProcessor
+from dataset_io import read_sidecar
+
+
+class StubClient:
+    """Клиент архива ЦБ РФ, отвечающий заданной функцией вместо сети"""
+
+    def __init__(self, rates_for_date):
+        self.rates_for_date = rates_for_date
+        self.requested = []
+
+    def get_daily(self, date_str):
+        self.requested.append(date_str)
+        rates = self.rates_for_date(date_str)
+        if rates is None:
+            return None
+        return {
+            "Valute": {
+                code: {"Nominal": 1, "Value": value} for code, value in rates.items()
+            }
+        }
+
+    def flush(self):
+        pass
 
 
 class TestDataProcessor(unittest.TestCase):
@@ -65,6 +93,83 @@ class TestDataProcessor(unittest.TestCase):
         result = self.processor.get_data_by_date(datetime(2025, 1, 1))
         self.assertIsNone(result)
 
+    def test_get_data_by_date_unsorted_dataset(self):
+        """Поиск по индексу в неотсортированном датасете находит первую строку"""
+        self.processor.current_dataset = pd.DataFrame(
+            {
+                "Date": pd.to_datetime(["2020-01-03", "2020-01-01", "2020-01-03"]),
+                "INR_Rate": [0.87, 0.85, 0.88],
+            }
+        )
+        self.assertEqual(self.processor.get_data_by_date(datetime(2020, 1, 3)), 0.87)
+        self.assertEqual(self.processor.get_data_by_date(datetime(2020, 1, 1)), 0.85)
+        self.assertIsNone(self.processor.get_data_by_date(datetime(2020, 1, 2)))
+
+    def test_get_data_as_of_returns_last_published_rate(self):
+        """На выходной возвращается курс предыдущей даты публикации"""
+        self.processor.current_dataset = pd.DataFrame(
+            {
+                "Date": pd.to_datetime(["2020-01-10", "2020-01-09", "2020-01-13"]),
+                "INR_Rate": [0.86, 0.85, float("nan")],
+            }
+        )
+
+        self.assertEqual(
+            self.processor.get_data_as_of(datetime(2020, 1, 12)),
+            (0.86, datetime(2020, 1, 10)),
+        )
+        self.assertEqual(
+            self.processor.get_data_as_of(datetime(2020, 1, 9)),
+            (0.85, datetime(2020, 1, 9)),
+        )
+        # Пустой курс 13-го пропускается
+        self.assertEqual(
+            self.processor.get_data_as_of(datetime(2020, 1, 13))[1],
+            datetime(2020, 1, 10),
+        )
+        self.assertIsNone(self.processor.get_data_as_of(datetime(2020, 1, 8)))
+
+    def test_get_data_as_of_dates_batch(self):
+        """Пакетный as-of поиск возвращает курсы и даты публикации"""
+        self.processor.set_dataset_path(self.test_dir)
+
+        rates, effective = self.processor.get_data_as_of_dates(
+            ["2019-12-31", "2020-01-02", "2020-01-05"]
+        )
+
+        self.assertTrue(pd.isna(rates[0]))
+        self.assertEqual(rates[1:].tolist(), [0.86, 0.87])
+        self.assertEqual(
+            [str(day) for day in effective], ["NaT", "2020-01-02", "2020-01-03"]
+        )
+
+    def test_lookup_index_follows_swapped_dataset(self):
+        """Индекс, построенный по старому датасету, не применяется к новому"""
+        self.processor.set_dataset_path(self.test_dir)
+        self.assertEqual(self.processor.get_data_as_of(datetime(2020, 1, 5))[0], 0.87)
+
+        # Подмена таблицы в обход сеттера, как при гонке с потоком загрузки
+        self.processor._current_dataset = pd.DataFrame(
+            {
+                "Date": pd.to_datetime(["2020-01-05", "2020-01-01"]),
+                "INR_Rate": [0.95, 0.91],
+            }
+        )
+
+        self.assertEqual(self.processor.get_data_by_date(datetime(2020, 1, 5)), 0.95)
+        self.assertEqual(self.processor.get_data_as_of(datetime(2020, 1, 6))[0], 0.95)
+        self.assertEqual(
+            self.processor.get_data_by_dates(["2020-01-01"]).tolist(), [0.91]
+        )
+        self.assertEqual(
+            len(
+                self.processor.get_data_by_range(
+                    datetime(2020, 1, 1), datetime(2020, 1, 3)
+                )
+            ),
+            1,
+        )
+
     def test_split_to_xy_success(self):
         """Тест разделения на X/Y файлы"""
         self.processor.set_dataset_path(self.test_dir)
@@ -80,6 +185,432 @@ class TestDataProcessor(unittest.TestCase):
         self.assertTrue(os.path.exists(x_path))
         self.assertTrue(os.path.exists(y_path))
 
+    def test_download_new_data_concurrent_keeps_date_order(self):
+        """Параллельная загрузка сохраняет порядок дат"""
+
+        def rates(date_str):
+            # Ранние даты отвечают дольше, чтобы перемешать порядок завершения
+            time.sleep(0.01 if date_str.endswith("01") else 0)
+            return None if date_str.endswith("04") else {"INR": float(date_str[-2:])}
+
+        self.processor.set_dataset_path(self.test_dir)
+        self.processor.client = StubClient(rates)
+        result = self.processor.download_new_data(
+            datetime(2020, 1, 1), datetime(2020, 1, 6), max_workers=4
+        )
+
+        self.assertTrue(result["success"])
+        self.assertEqual(result["records_count"], 5)
+        self.assertEqual(result["dates_count"], 6)
+        self.assertGreater(result["dates_per_second"], 0)
+        saved = pd.read_csv(self.test_csv_path)
+        self.assertEqual(
+            saved["Date"].tolist(),
+            ["2020-01-01", "2020-01-02", "2020-01-03", "2020-01-05", "2020-01-06"],
+        )
+
+    def test_download_new_data_invalid_workers(self):
+        """Негативный тест: неверное число потоков"""
+        self.processor.set_dataset_path(self.test_dir)
+        result = self.processor.download_new_data(
+            datetime(2020, 1, 1), datetime(2020, 1, 2), max_workers=0
+        )
+        self.assertIn("error", result)
+
+    def test_download_new_data_incremental_appends_new_dates(self):
+        """Инкрементальная загрузка дописывает только новые даты"""
+        self.processor.set_dataset_path(self.test_dir)
+        client = StubClient(lambda date_str: {"INR": 0.9})
+        self.processor.client = client
+
+        with mock.patch.object(self.processor, "set_dataset_path") as reload:
+            result = self.processor.download_new_data(
+                datetime(2016, 1, 1), datetime(2020, 1, 5), mode="incremental"
+            )
+
+        self.assertTrue(result["success"])
+        self.assertEqual(sorted(client.requested), ["2020/01/04", "2020/01/05"])
+        reload.assert_not_called()
+        self.assertEqual(len(self.processor.current_dataset), 5)
+        # Индекс дат обновлен вместе с датасетом
+        self.assertEqual(self.processor.get_data_by_date(datetime(2020, 1, 5)), 0.9)
+        saved = pd.read_csv(self.test_csv_path)
+        self.assertEqual(saved["Date"].tolist()[-2:], ["2020-01-04", "2020-01-05"])
+        self.assertEqual(saved["INR_Rate"].tolist()[:3], [0.85, 0.86, 0.87])
+
+    def test_incremental_append_with_missing_rate_refreshes_sidecar(self):
+        """Пустой курс при дозагрузке не ломает тип столбца и бинарную копию"""
+        self.processor.set_dataset_path(self.test_dir)
+        self.processor.client = StubClient(
+            lambda date_str: (
+                {"INR": 0.9, "USD": 90.0} if date_str.endswith("04") else {"INR": 0.91}
+            )
+        )
+        self.processor.current_dataset["USD_Rate"] = 89.0
+        self.processor.current_dataset.to_csv(self.test_csv_path, index=False)
+        self.processor.set_dataset_path(self.test_dir)
+
+        self.processor.download_new_data(
+            end_date=datetime(2020, 1, 5), mode="incremental"
+        )
+
+        df = self.processor.current_dataset
+        self.assertEqual(df["USD_Rate"].dtype, "float64")
+        self.assertTrue(pd.isna(df["USD_Rate"].iloc[-1]))
+        cached = read_sidecar(self.test_csv_path)
+        self.assertIsNotNone(cached)
+        self.assertEqual(len(cached), 5)
+
+    def test_incremental_append_survives_sidecar_write_error(self):
+        """Ошибка записи бинарной копии не отменяет успешную дозагрузку"""
+        self.processor.set_dataset_path(self.test_dir)
+        self.processor.client = StubClient(lambda date_str: {"INR": 0.9})
+
+        with mock.patch(
+            "data_processor.write_sidecar", side_effect=PermissionError("denied")
+        ):
+            result = self.processor.download_new_data(
+                end_date=datetime(2020, 1, 5), mode="incremental"
+            )
+
+        self.assertTrue(result["success"])
+        self.assertEqual(len(self.processor.current_dataset), 5)
+        saved = pd.read_csv(self.test_csv_path)
+        self.assertEqual(saved["Date"].tolist()[-1], "2020-01-05")
+
+    def test_download_new_data_compressed_folder(self):
+        """Полная загрузка и дозагрузка в папку со сжатием gzip"""
+        self.processor.set_dataset_path(self.test_dir)
+        self.processor.set_compression("gzip")
+        self.processor.client = StubClient(lambda date_str: {"INR": 0.9})
+
+        result = self.processor.download_new_data(
+            datetime(2020, 1, 1), datetime(2020, 1, 3), mode="replace"
+        )
+        self.assertTrue(result["success"])
+        gz_path = self.test_csv_path + ".gz"
+        self.assertTrue(os.path.exists(gz_path))
+        self.assertFalse(os.path.exists(self.test_csv_path))
+
+        result = self.processor.download_new_data(
+            datetime(2020, 1, 1), datetime(2020, 1, 5), mode="incremental"
+        )
+        self.assertEqual(result["records_count"], 2)
+        saved = pd.read_csv(gz_path)
+        self.assertEqual(len(saved), 5)
+        self.assertEqual(saved["Date"].tolist()[-1], "2020-01-05")
+        self.assertTrue(DataProcessor().set_dataset_path(self.test_dir))
+
+    def test_download_new_data_merge_keeps_history(self):
+        """Слияние обновляет пересекающиеся даты и не теряет остальные"""
+        self.processor.set_dataset_path(self.test_dir)
+        self.processor.client = StubClient(
+            lambda date_str: None if date_str.endswith("04") else {"INR": 0.9}
+        )
+
+        result = self.processor.download_new_data(
+            datetime(2020, 1, 2), datetime(2020, 1, 5), mode="merge"
+        )
+
+        self.assertTrue(result["success"])
+        self.assertEqual(result["records_count"], 3)
+        saved = pd.read_csv(self.test_csv_path)
+        self.assertEqual(
+            saved["Date"].tolist(),
+            ["2020-01-01", "2020-01-02", "2020-01-03", "2020-01-05"],
+        )
+        self.assertEqual(saved["INR_Rate"].tolist(), [0.85, 0.9, 0.9, 0.9])
+        self.assertEqual(len(self.processor.current_dataset), 4)
+        self.assertFalse(os.path.exists(self.test_csv_path + ".part"))
+
+    def test_download_new_data_merge_adds_currency_columns(self):
+        """Слияние с новой валютой добавляет столбец, старые курсы остаются"""
+        self.processor.set_dataset_path(self.test_dir)
+        self.processor.client = StubClient(lambda date_str: {"USD": 70.0})
+
+        result = self.processor.download_new_data(
+            datetime(2020, 1, 3), datetime(2020, 1, 4), mode="merge", currencies="USD"
+        )
+
+        self.assertTrue(result["success"])
+        saved = pd.read_csv(self.test_csv_path)
+        self.assertEqual(list(saved.columns), ["Date", "INR_Rate", "USD_Rate"])
+        self.assertEqual(saved["INR_Rate"].tolist()[:3], [0.85, 0.86, 0.87])
+        self.assertTrue(pd.isna(saved["INR_Rate"].iloc[3]))
+        self.assertEqual(saved["USD_Rate"].tolist()[2:], [70.0, 70.0])
+
+    def test_download_new_data_incremental_up_to_date(self):
+        """Инкрементальная загрузка без новых дат не обращается к сети"""
+        self.processor.set_dataset_path(self.test_dir)
+        client = StubClient(lambda date_str: {"INR": 0.9})
+        self.processor.client = client
+
+        result = self.processor.download_new_data(
+            end_date=datetime(2020, 1, 3), mode="incremental"
+        )
+        self.assertTrue(result["success"])
+        self.assertEqual(result["records_count"], 0)
+        self.assertEqual(client.requested, [])
+
+    def test_download_new_data_counts_errors_separately(self):
+        """Сетевые ошибки не смешиваются с отсутствием данных"""
+
+        def rates(date_str):
+            if date_str.endswith("02"):
+                raise FetchError(date_str)
+            return None if date_str.endswith("03") else {"INR": 0.9}
+
+        self.processor.set_dataset_path(self.test_dir)
+        self.processor.client = StubClient(rates)
+        result = self.processor.download_new_data(
+            datetime(2020, 1, 1), datetime(2020, 1, 3)
+        )
+
+        self.assertEqual(result["records_count"], 1)
+        self.assertEqual(result["missing_count"], 1)
+        self.assertEqual(result["errors_count"], 1)
+        self.assertEqual(result["failed_dates"], ["2020/01/02"])
+
+    def test_failed_dates_are_queued_and_retried(self):
+        """Даты с ошибкой сети попадают в очередь и догружаются отдельно"""
+        network_down = {"2020/01/05", "2020/01/07"}
+
+        def rates(date_str):
+            if date_str in network_down:
+                raise FetchError(date_str)
+            return None if date_str.endswith("06") else {"INR": 0.9}
+
+        self.processor.set_dataset_path(self.test_dir)
+        self.processor.client = StubClient(rates)
+        self.processor.download_new_data(
+            datetime(2020, 1, 4), datetime(2020, 1, 8), mode="merge"
+        )
+
+        self.assertEqual(
+            self.processor.get_failed_dates(), ["2020/01/05", "2020/01/07"]
+        )
+        self.assertTrue(
+            os.path.exists(os.path.join(self.test_dir, "failed_dates.json"))
+        )
+
+        network_down.discard("2020/01/05")
+        client = StubClient(rates)
+        self.processor.client = client
+        result = self.processor.retry_failed()
+
+        self.assertEqual(sorted(client.requested), ["2020/01/05", "2020/01/07"])
+        self.assertEqual(result["records_count"], 1)
+        self.assertEqual(result["queued_count"], 1)
+        self.assertEqual(self.processor.get_failed_dates(), ["2020/01/07"])
+        saved = pd.read_csv(self.test_csv_path)
+        self.assertEqual(
+            saved["Date"].tolist(),
+            [
+                "2020-01-01",
+                "2020-01-02",
+                "2020-01-03",
+                "2020-01-04",
+                "2020-01-05",
+                "2020-01-08",
+            ],
+        )
+        self.assertEqual(len(self.processor.current_dataset), 6)
+
+        network_down.clear()
+        self.processor.client = StubClient(rates)
+        self.processor.retry_failed()
+        self.assertEqual(self.processor.get_failed_dates(), [])
+        self.assertFalse(
+            os.path.exists(os.path.join(self.test_dir, "failed_dates.json"))
+        )
+        self.assertEqual(len(pd.read_csv(self.test_csv_path)), 7)
+
+    def test_retry_failed_keeps_currencies_of_each_group(self):
+        """Повторная ошибка в одной группе не меняет валюты ее дат"""
+        self.processor.set_dataset_path(self.test_dir)
+        self.processor.client = StubClient(
+            lambda date_str: (_ for _ in ()).throw(FetchError(date_str))
+        )
+        self.processor.download_new_data(
+            datetime(2020, 1, 4), datetime(2020, 1, 4), mode="merge"
+        )
+        self.processor.download_new_data(
+            datetime(2020, 1, 5), datetime(2020, 1, 5), mode="merge", currencies="USD"
+        )
+
+        result = self.processor.retry_failed()
+
+        self.assertEqual(result["errors_count"], 2)
+        with open(os.path.join(self.test_dir, "failed_dates.json")) as f:
+            queue = json.load(f)["dates"]
+        self.assertEqual(queue, {"2020/01/04": ["INR"], "2020/01/05": ["USD"]})
+
+    def test_retry_failed_with_empty_queue(self):
+        """Без очереди повторная загрузка не обращается к сети"""
+        self.processor.set_dataset_path(self.test_dir)
+        client = StubClient(lambda date_str: {"INR": 0.9})
+        self.processor.client = client
+
+        result = self.processor.retry_failed()
+
+        self.assertTrue(result["success"])
+        self.assertEqual(result["records_count"], 0)
+        self.assertEqual(client.requested, [])
+
+    def test_download_new_data_multiple_currencies(self):
+        """Несколько валют из одного ответа записываются в широкий датасет"""
+        client = StubClient(
+            lambda date_str: (
+                {"INR": 0.9, "USD": 90.0, "EUR": 99.0}
+                if not date_str.endswith("02")
+                else {"INR": 0.91}
+            )
+        )
+        self.processor.set_dataset_path(self.test_dir)
+        self.processor.client = client
+
+        result = self.processor.download_new_data(
+            datetime(2020, 1, 1), datetime(2020, 1, 3), currencies=["INR", "USD"]
+        )
+
+        self.assertTrue(result["success"])
+        self.assertEqual(len(client.requested), 3)
+        saved = pd.read_csv(self.test_csv_path)
+        self.assertEqual(saved.columns.tolist(), ["Date", "INR_Rate", "USD_Rate"])
+        self.assertEqual(saved["USD_Rate"].isna().tolist(), [False, True, False])
+        self.assertEqual(
+            self.processor.current_dataset.columns.tolist(),
+            ["Date", "INR_Rate", "USD_Rate"],
+        )
+
+    def test_download_new_data_all_currencies(self):
+        """Режим "all" берет набор валют из последнего ответа архива"""
+        self.processor.set_dataset_path(self.test_dir)
+        self.processor.client = StubClient(lambda date_str: {"USD": 90.0, "EUR": 99.0})
+
+        result = self.processor.download_new_data(
+            datetime(2020, 1, 1), datetime(2020, 1, 2), currencies="all"
+        )
+
+        self.assertEqual(result["currencies"], ["EUR", "USD"])
+        saved = pd.read_csv(self.test_csv_path)
+        self.assertEqual(saved.columns.tolist(), ["Date", "EUR_Rate", "USD_Rate"])
+
+    def test_download_new_data_resumes_after_crash(self):
+        """Прерванная загрузка не портит dataset.csv и продолжается с чекпоинта"""
+
+        def crashing(date_str):
+            if date_str == "2020/01/06":
+                raise RuntimeError("crash")
+            return {"INR": float(date_str[-2:])}
+
+        self.processor.set_dataset_path(self.test_dir)
+        self.processor.client = StubClient(crashing)
+        with mock.patch("data_processor.CHECKPOINT_EVERY", 2):
+            result = self.processor.download_new_data(
+                datetime(2020, 1, 1), datetime(2020, 1, 8), max_workers=1
+            )
+
+            self.assertIn("error", result)
+            self.assertEqual(len(pd.read_csv(self.test_csv_path)), 3)
+            self.assertTrue(os.path.exists(self.test_csv_path + ".checkpoint"))
+
+            client = StubClient(lambda date_str: {"INR": float(date_str[-2:])})
+            self.processor.client = client
+            result = self.processor.download_new_data(
+                datetime(2020, 1, 1), datetime(2020, 1, 8), max_workers=1
+            )
+
+        self.assertTrue(result["success"])
+        self.assertEqual(
+            client.requested, ["2020/01/05", "2020/01/06", "2020/01/07", "2020/01/08"]
+        )
+        self.assertEqual(result["records_count"], 8)
+        saved = pd.read_csv(self.test_csv_path)
+        self.assertEqual(saved["INR_Rate"].tolist(), [float(d) for d in range(1, 9)])
+
+    def test_download_new_data_resumes_with_later_end_date(self):
+        """Чекпоинт подходит и для повтора с более поздней конечной датой"""
+
+        def crashing(date_str):
+            if date_str == "2020/01/06":
+                raise RuntimeError("crash")
+            return {"INR": float(date_str[-2:])}
+
+        self.processor.set_dataset_path(self.test_dir)
+        self.processor.client = StubClient(crashing)
+        with mock.patch("data_processor.CHECKPOINT_EVERY", 2):
+            self.processor.download_new_data(
+                datetime(2020, 1, 1), datetime(2020, 1, 8), max_workers=1
+            )
+            client = StubClient(lambda date_str: {"INR": float(date_str[-2:])})
+            self.processor.client = client
+            result = self.processor.download_new_data(
+                datetime(2020, 1, 1), datetime(2020, 1, 9), max_workers=1
+            )
+
+        self.assertEqual(client.requested[0], "2020/01/05")
+        self.assertEqual(result["records_count"], 9)
+        self.assertEqual(len(pd.read_csv(self.test_csv_path)), 9)
+        self.assertFalse(os.path.exists(self.test_csv_path + ".checkpoint"))
+        self.assertFalse(os.path.exists(self.test_csv_path + ".part"))
+
+    def test_download_new_data_cancel_merges_progress(self):
+        """Отмена слияния сразу сохраняет загруженное в dataset.csv"""
+        cancel_event = threading.Event()
+
+        def rates(date_str):
+            if date_str == "2020/01/05":
+                cancel_event.set()
+            return {"INR": 0.9}
+
+        self.processor.set_dataset_path(self.test_dir)
+        self.processor.client = StubClient(rates)
+        result = self.processor.download_new_data(
+            datetime(2020, 1, 3),
+            datetime(2020, 1, 31),
+            max_workers=1,
+            mode="merge",
+            cancel_event=cancel_event,
+        )
+
+        self.assertTrue(result["cancelled"])
+        self.assertGreater(result["records_count"], 0)
+        self.assertLess(result["records_count"], 29)
+        saved = pd.read_csv(self.test_csv_path)
+        # 01-01 и 01-02 из старого датасета, дальше - загруженное до отмены
+        self.assertEqual(len(saved), 2 + result["records_count"])
+        self.assertEqual(saved["INR_Rate"].tolist()[:3], [0.85, 0.86, 0.9])
+        self.assertEqual(len(self.processor.current_dataset), len(saved))
+        self.assertFalse(os.path.exists(self.test_csv_path + ".part"))
+        self.assertFalse(os.path.exists(self.test_csv_path + ".checkpoint"))
+
+    def test_download_new_data_cancel_keeps_progress(self):
+        """Отмена сохраняет загруженное в чекпоинте и не трогает dataset.csv"""
+        cancel_event = threading.Event()
+        progress = []
+
+        def rates(date_str):
+            if date_str == "2020/01/03":
+                cancel_event.set()
+            return {"INR": 0.9}
+
+        self.processor.set_dataset_path(self.test_dir)
+        self.processor.client = StubClient(rates)
+        result = self.processor.download_new_data(
+            datetime(2020, 1, 1),
+            datetime(2020, 1, 31),
+            max_workers=1,
+            progress_callback=progress.append,
+            cancel_event=cancel_event,
+        )
+
+        self.assertTrue(result["cancelled"])
+        self.assertLess(result["records_count"], 31)
+        self.assertEqual(len(pd.read_csv(self.test_csv_path)), 3)
+        self.assertTrue(os.path.exists(self.test_csv_path + ".checkpoint"))
+        self.assertEqual(progress[0]["total"], 31)
+
 
 if __name__ == "__main__":
     unittest.main()
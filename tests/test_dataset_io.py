@@ -0,0 +1,244 @@
+import os
+import sys
+from datetime import datetime
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import dataset_io
+from dataset_io import (
+    DateIndex,
+    RateStore,
+    SchemaError,
+    compression_of,
+    count_rows,
+    csv_name,
+    find_csv,
+    get_compression,
+    load_dataset,
+    read_header,
+    read_rates_csv,
+    read_sidecar,
+    set_compression,
+    sidecar_dir,
+    write_sidecar,
+)
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / "dataset.csv"
+    pd.DataFrame(
+        {
+            "Date": ["2020-01-01", "2020-01-02", "2020-01-04"],
+            "INR_Rate": [1.1, 1.2, 1.3],
+            "USD_Rate": [70.0, 71.5, 72.25],
+        }
+    ).to_csv(path, index=False)
+    return str(path)
+
+
+class TestSidecar:
+
+    def test_first_load_writes_sidecar(self, csv_path):
+        df = load_dataset(csv_path)
+
+        assert os.path.exists(os.path.join(sidecar_dir(csv_path), "meta.json"))
+        cached = read_sidecar(csv_path)
+        pd.testing.assert_frame_equal(cached, df)
+        assert cached["Date"].dtype == pd.to_datetime(pd.Series(["2020-01-01"])).dtype
+
+    def test_second_load_skips_csv_parsing(self, csv_path):
+        expected = load_dataset(csv_path)
+
+        with patch.object(dataset_io.pd, "read_csv") as read_csv:
+            df = load_dataset(csv_path)
+
+        read_csv.assert_not_called()
+        pd.testing.assert_frame_equal(df, expected)
+
+    def test_changed_csv_invalidates_sidecar(self, csv_path):
+        load_dataset(csv_path)
+        with open(csv_path, "a", encoding="utf-8") as f:
+            f.write("2020-01-05,1.4,73.0\n")
+
+        assert read_sidecar(csv_path) is None
+        df = load_dataset(csv_path)
+        assert len(df) == 4
+        assert len(read_sidecar(csv_path)) == 4
+
+    def test_non_numeric_columns_are_not_cached(self, tmp_path):
+        path = str(tmp_path / "notes.csv")
+        df = pd.DataFrame(
+            {"Date": pd.to_datetime(["2020-01-01"]), "Note": ["праздник"]}
+        )
+        df.to_csv(path, index=False)
+
+        assert write_sidecar(path, df) is False
+        assert not os.path.exists(sidecar_dir(path))
+
+    def test_missing_values_round_trip_as_nan(self, tmp_path):
+        path = str(tmp_path / "dataset.csv")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("Date,INR_Rate,USD_Rate\n2020-01-01,1.1,\n2020-01-02,,71.0\n")
+
+        load_dataset(path)
+        df = read_sidecar(path)
+
+        assert np.isnan(df["USD_Rate"].iloc[0])
+        assert np.isnan(df["INR_Rate"].iloc[1])
+        assert df["USD_Rate"].iloc[1] == 71.0
+
+
+class TestRateStore:
+
+    def test_lookup_uses_memory_mapped_arrays(self, csv_path):
+        store = RateStore(csv_path)
+
+        assert isinstance(store.days, np.memmap)
+        assert isinstance(store.values, np.memmap)
+        assert len(store) == 3
+        assert store.lookup(datetime(2020, 1, 2)) == 1.2
+        assert store.lookup("2020-01-04", "USD_Rate") == 72.25
+        assert store.lookup(datetime(2020, 1, 3)) is None
+
+    def test_lookup_many_returns_nan_for_misses(self, csv_path):
+        store = RateStore(csv_path)
+
+        rates = store.lookup_many(
+            ["2019-12-31", "2020-01-01", "2020-01-03", "2020-01-04", "2020-02-01"],
+            "USD",
+        )
+
+        np.testing.assert_array_equal(np.isnan(rates), [True, False, True, False, True])
+        assert rates[1] == 70.0 and rates[3] == 72.25
+
+    def test_unsorted_dates_are_found(self, tmp_path):
+        path = tmp_path / "dataset.csv"
+        path.write_text(
+            "Date,INR_Rate\n2020-01-03,1.3\n2020-01-01,1.1\n2020-01-03,1.4\n"
+        )
+
+        store = RateStore(str(path))
+
+        assert store.lookup("2020-01-03") == 1.3
+        assert store.lookup("2020-01-01") == 1.1
+        assert store.lookup("2020-01-02") is None
+
+    def test_create_false_does_not_write_sidecar(self, csv_path):
+        with pytest.raises(ValueError):
+            RateStore(csv_path, create=False)
+
+        assert not os.path.exists(sidecar_dir(csv_path))
+
+    def test_unknown_currency(self, csv_path):
+        with pytest.raises(KeyError):
+            RateStore(csv_path).lookup("2020-01-01", "EUR")
+
+    def test_rewritten_sidecar_does_not_break_open_store(self, csv_path):
+        store = RateStore(csv_path)
+        df = load_dataset(csv_path)
+        df["INR_Rate"] = df["INR_Rate"] * 2
+        write_sidecar(csv_path, df)
+
+        assert store.lookup("2020-01-01") == 1.1
+        assert RateStore(csv_path).lookup("2020-01-01") == 2.2
+
+
+class TestDateIndex:
+
+    def test_sorted_dates_keep_row_order(self):
+        index = DateIndex(pd.to_datetime(["2020-01-01", "2020-01-02", "2020-01-04"]))
+
+        assert index.order is None
+        assert index.position(datetime(2020, 1, 4)) == 2
+        assert index.position("2020-01-03") is None
+        np.testing.assert_array_equal(
+            index.positions(["2020-01-02", "2019-12-31", "2021-01-01"]), [1, -1, -1]
+        )
+
+    def test_unsorted_dates_map_to_original_rows(self):
+        index = DateIndex(pd.to_datetime(["2020-01-03", "2020-01-01", "2020-01-03"]))
+
+        assert index.position("2020-01-03") == 0
+        assert index.position("2020-01-01") == 1
+        np.testing.assert_array_equal(
+            index.positions(["2020-01-01", "2020-01-02", "2020-01-03"]), [1, -1, 0]
+        )
+
+    def test_empty_index(self):
+        index = DateIndex(pd.to_datetime([]))
+
+        assert len(index) == 0
+        assert index.position("2020-01-01") is None
+        np.testing.assert_array_equal(index.positions(["2020-01-01"]), [-1])
+
+
+class TestSchemaLoader:
+
+    def test_reads_declared_dtypes(self, csv_path):
+        df = read_rates_csv(csv_path)
+
+        assert list(df.columns) == ["Date", "INR_Rate", "USD_Rate"]
+        assert pd.api.types.is_datetime64_any_dtype(df["Date"])
+        assert df["INR_Rate"].dtype == np.float64
+        assert df["Date"].iloc[2] == pd.Timestamp("2020-01-04")
+
+    def test_usecols_keeps_requested_order(self, csv_path):
+        df = read_rates_csv(csv_path, usecols=["USD_Rate", "Date"])
+
+        assert list(df.columns) == ["USD_Rate", "Date"]
+
+    def test_missing_columns_raise_schema_error(self, csv_path, tmp_path):
+        with pytest.raises(SchemaError):
+            read_rates_csv(csv_path, usecols=["EUR_Rate"])
+        with pytest.raises(SchemaError):
+            load_dataset(csv_path, usecols=["EUR_Rate"])
+
+        rates_only = tmp_path / "Y.csv"
+        rates_only.write_text("INR_Rate\n1.5\n", encoding="utf-8")
+        with pytest.raises(SchemaError):
+            read_rates_csv(str(rates_only))
+        assert read_rates_csv(str(rates_only), require_date=False)["INR_Rate"][0] == 1.5
+
+    def test_dates_with_time_are_still_parsed(self, tmp_path):
+        path = tmp_path / "X.csv"
+        path.write_text("Date\n2020-01-01 00:00:00\n2020-01-02 00:00:00\n")
+
+        df = read_rates_csv(str(path))
+
+        assert df["Date"].iloc[1] == pd.Timestamp("2020-01-02")
+
+
+class TestCompression:
+
+    @pytest.mark.parametrize("compression", ["gzip", "bz2", "xz"])
+    def test_compressed_files_are_read_transparently(self, tmp_path, compression):
+        plain = pd.DataFrame(
+            {"Date": ["2020-01-01", "2020-01-02"], "INR_Rate": [1.5, 2.5]}
+        )
+        path = tmp_path / csv_name("dataset.csv", compression)
+        plain.to_csv(path, index=False)
+
+        assert compression_of(str(path)) == compression
+        assert find_csv(str(tmp_path), "dataset.csv") == str(path)
+        assert read_header(str(path)) == ["Date", "INR_Rate"]
+        assert count_rows(str(path)) == 2
+        assert load_dataset(str(path))["INR_Rate"].tolist() == [1.5, 2.5]
+
+    def test_folder_setting_selects_preferred_variant(self, tmp_path):
+        (tmp_path / "X.csv").write_text("Date\n")
+        (tmp_path / "X.csv.xz").write_bytes(b"")
+
+        assert get_compression(str(tmp_path)) is None
+        assert find_csv(str(tmp_path), "X.csv") == str(tmp_path / "X.csv")
+        set_compression(str(tmp_path), "xz")
+        assert get_compression(str(tmp_path)) == "xz"
+        assert find_csv(str(tmp_path), "X.csv") == str(tmp_path / "X.csv.xz")
+        assert find_csv(str(tmp_path), "Y.csv") is None
+        with pytest.raises(ValueError):
+            set_compression(str(tmp_path), "zip")
@@ -2,10 +2,11 @@ import pytest
 import pandas as pd
 import os
 import sys
-from datetime import datetime
+from datetime import date, datetime
 
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
+from cbr_replay import ReplayArchiveAdapter, SyntheticArchive, replay_client
 from data_processor import DataProcessor
 from data_analysis import DataAnalyzer
 
@@ -67,3 +68,22 @@ class TestIntegration:
 
         stats = analyzer.calculate_statistics()
         assert stats.empty
+
+    def test_download_against_replay_archive(self, tmp_path):
+        archive = SyntheticArchive(missing_dates=[date(2020, 1, 7)])
+        adapter = ReplayArchiveAdapter(archive.payload, latency=0.001, error_rate=0.2)
+        client = replay_client(adapter, max_retries=8, backoff_factor=0)
+
+        processor = DataProcessor(client=client)
+        processor.dataset_path = str(tmp_path)
+        result = processor.download_new_data(
+            datetime(2020, 1, 1), datetime(2020, 2, 29), max_workers=8
+        )
+
+        expected = archive.expected_rates(date(2020, 1, 1), date(2020, 2, 29))
+        saved = pd.read_csv(tmp_path / "dataset.csv")
+        assert result["success"]
+        assert result["errors_count"] == 0
+        assert adapter.errors_count > 0
+        assert saved["Date"].tolist() == list(expected)
+        assert saved["INR_Rate"].tolist() == pytest.approx(list(expected.values()))
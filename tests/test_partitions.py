@@ -0,0 +1,275 @@
+import os
+import sys
+from datetime import datetime
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from data_processor import DataProcessor
+from partitions import (
+    PartitionCache,
+    files_for_date,
+    manifest_entries,
+    partition_cache,
+    partition_files,
+    partition_keys,
+    write_partitions,
+)
+
+
+@pytest.fixture
+def processor(tmp_path):
+    dates = pd.date_range(start="2019-12-20", end="2020-01-20", freq="D")
+    df = pd.DataFrame({"Date": dates, "INR_Rate": range(len(dates))})
+    df.to_csv(tmp_path / "dataset.csv", index=False)
+    processor = DataProcessor()
+    assert processor.set_dataset_path(str(tmp_path))
+    return processor
+
+
+class TestPartitionManifest:
+
+    def test_split_writes_manifest(self, processor, tmp_path):
+        out = tmp_path / "weeks"
+        out.mkdir()
+        result = processor.split_by_weeks(str(out))
+
+        entries = manifest_entries(str(out), "weeks")
+        assert [entry["file"] for entry in entries] == sorted(result["files"])
+        assert sum(entry["rows"] for entry in entries) == 32
+        first = entries[0]
+        assert (first["start"], first["end"]) == ("2019-12-20", "2019-12-22")
+        assert first["bytes"] == os.path.getsize(out / first["file"])
+        assert manifest_entries(str(out), "years") is None
+
+    def test_lookup_opens_one_file_or_none(self, processor, tmp_path):
+        processor.split_by_years(str(tmp_path))
+        candidates = ["a.csv", "b.csv"]
+
+        assert files_for_date(
+            str(tmp_path), "years", datetime(2020, 1, 5), candidates
+        ) == [str(tmp_path / "20200101_20200120.csv")]
+        assert (
+            files_for_date(str(tmp_path), "years", datetime(2020, 2, 1), candidates)
+            == []
+        )
+        assert (
+            files_for_date(str(tmp_path), "weeks", datetime(2020, 1, 5), candidates)
+            == candidates
+        )
+
+    def test_changed_file_falls_back_to_scan(self, processor, tmp_path):
+        processor.split_by_years(str(tmp_path))
+        with open(tmp_path / "20200101_20200120.csv", "a") as f:
+            f.write("2020-01-21,99\n")
+
+        assert files_for_date(
+            str(tmp_path), "years", datetime(2020, 1, 5), ["x.csv"]
+        ) == ["x.csv"]
+
+    def test_lookup_reuses_parsed_manifest_and_listing(self, processor, tmp_path):
+        processor.split_by_years(str(tmp_path))
+        files_for_date(str(tmp_path), "years", datetime(2020, 1, 5))
+
+        with patch("partitions.json.load") as load, patch(
+            "partitions.os.listdir"
+        ) as listdir:
+            found = files_for_date(str(tmp_path), "years", datetime(2020, 1, 5))
+            processor.get_data_by_dates(["2020-01-05"], layout="years")
+
+        assert found == [str(tmp_path / "20200101_20200120.csv")]
+        load.assert_not_called()
+        listdir.assert_not_called()
+
+    def test_listing_refreshes_when_folder_changes(self, tmp_path):
+        (tmp_path / "20200101_20200107.csv").write_text("Date,INR_Rate\n")
+        assert files_for_date(str(tmp_path), "weeks", datetime(2020, 1, 5)) == [
+            str(tmp_path / "20200101_20200107.csv")
+        ]
+
+        (tmp_path / "20200108_20200114.csv.gz").write_bytes(b"")
+        (tmp_path / "notes.csv").write_text("")
+
+        assert partition_files(str(tmp_path)) == [
+            str(tmp_path / "20200101_20200107.csv"),
+            str(tmp_path / "20200108_20200114.csv.gz"),
+        ]
+        assert partition_files(str(tmp_path), prefix="2019") == []
+
+
+class TestBatchLookup:
+
+    DATES = ["2019-12-20", "2020-01-05", "2020-02-01", "2019-12-31", "2020-01-05"]
+    EXPECTED = [0, 16, np.nan, 11, 16]
+
+    def split(self, processor, layout, folder):
+        if layout == "xy":
+            processor.split_to_xy(folder)
+        elif layout == "years":
+            processor.split_by_years(folder)
+        elif layout == "weeks":
+            processor.split_by_weeks(folder)
+
+    @pytest.mark.parametrize("layout", ["single", "xy", "years", "weeks"])
+    def test_layouts_return_aligned_rates(self, processor, tmp_path, layout):
+        out = tmp_path / layout
+        out.mkdir()
+        self.split(processor, layout, str(out))
+
+        rates = processor.get_data_by_dates(self.DATES, layout, folder=str(out))
+
+        np.testing.assert_array_equal(rates, self.EXPECTED)
+
+    def test_manifest_limits_files_read(self, processor, tmp_path):
+        processor.split_by_weeks(str(tmp_path))
+
+        partition_cache.clear()
+        processor.get_data_by_dates(["2020-01-05", "2020-01-04"], "weeks")
+
+        assert partition_cache.stats()["misses"] == 1
+
+    def test_scan_without_manifest(self, processor, tmp_path):
+        processor.split_by_years(str(tmp_path))
+        os.remove(tmp_path / "partitions.json")
+
+        rates = processor.get_data_by_dates(self.DATES, "years")
+
+        np.testing.assert_array_equal(rates, self.EXPECTED)
+
+    def test_broken_xy_files_return_nan(self, processor, tmp_path):
+        out = tmp_path / "xy"
+        out.mkdir()
+        processor.split_to_xy(str(out))
+        (out / "Y.csv").write_text("INR_Rate\n1.0\n2.0\n")
+
+        assert np.isnan(
+            processor.get_data_by_dates(self.DATES, "xy", folder=str(out))
+        ).all()
+
+        (out / "X.csv").write_text("When\n2020-01-01\n")
+        assert np.isnan(
+            processor.get_data_by_dates(self.DATES, "xy", folder=str(out))
+        ).all()
+
+    def test_unknown_currency_and_layout(self, processor):
+        assert np.isnan(processor.get_data_by_dates(["2020-01-05"], code="EUR")).all()
+        with pytest.raises(ValueError):
+            processor.get_data_by_dates(["2020-01-05"], "months")
+
+
+class TestPartitionCache:
+
+    def test_repeated_reads_hit_cache(self, processor, tmp_path):
+        processor.split_by_years(str(tmp_path))
+        path = str(tmp_path / "20200101_20200120.csv")
+        cache = PartitionCache()
+
+        first = cache.read(path, usecols=["Date", "INR_Rate"])
+        with patch("partitions.read_rates_csv") as read:
+            again = cache.read(path, usecols=["Date", "INR_Rate"])
+
+        read.assert_not_called()
+        assert again is first
+        assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+    def test_changed_file_is_read_again(self, tmp_path):
+        path = tmp_path / "20200101_20200102.csv"
+        path.write_text("Date,INR_Rate\n2020-01-01,1.5\n")
+        cache = PartitionCache()
+        cache.read(str(path))
+
+        path.write_text("Date,INR_Rate\n2020-01-01,1.5\n2020-01-02,2.5\n")
+
+        assert len(cache.read(str(path))) == 2
+        assert cache.misses == 2
+
+    def test_least_recently_used_is_evicted(self, tmp_path):
+        paths = []
+        for day in (1, 2, 3):
+            path = tmp_path / f"2020010{day}_2020010{day}.csv"
+            path.write_text(f"Date,INR_Rate\n2020-01-0{day},{day}\n")
+            paths.append(str(path))
+        cache = PartitionCache(max_entries=2)
+
+        cache.read(paths[0])
+        cache.read(paths[1])
+        cache.read(paths[0])
+        cache.read(paths[2])
+        cache.read(paths[0])
+
+        assert len(cache) == 2
+        assert cache.stats()["hits"] == 2
+        cache.read(paths[1])
+        assert cache.misses == 4
+
+
+class TestPartitionWriter:
+
+    def test_week_keys_match_isocalendar(self):
+        dates = pd.date_range("1999-12-20", "2021-01-10", freq="D")
+        iso = dates.isocalendar()
+
+        keys = partition_keys(dates.values.astype("datetime64[D]"), "weeks")
+
+        expected = (iso.year * 100 + iso.week).to_numpy(dtype="int64")
+        assert (keys == expected).all()
+
+    def test_files_match_groupby_split(self, tmp_path):
+        dates = pd.to_datetime(
+            ["2021-01-02", "2020-12-30", "2021-01-04", "2020-12-31", "2021-01-01"]
+        )
+        df = pd.DataFrame({"Date": dates, "INR_Rate": [1.5, 2.0, None, 3.25, 4.0]})
+
+        entries = write_partitions(df, str(tmp_path), "weeks")
+
+        assert [entry["file"] for entry in entries] == [
+            "20201230_20210102.csv",
+            "20210104_20210104.csv",
+        ]
+        assert (tmp_path / "20201230_20210102.csv").read_text() == (
+            "Date,INR_Rate\n2021-01-02,1.5\n2020-12-30,2.0\n"
+            "2020-12-31,3.25\n2021-01-01,4.0\n"
+        )
+        assert (tmp_path / "20210104_20210104.csv").read_text() == (
+            "Date,INR_Rate\n2021-01-04,\n"
+        )
+        assert entries[0]["rows"] == 4
+
+    def test_empty_dataset_writes_nothing(self, tmp_path):
+        df = pd.DataFrame({"Date": pd.to_datetime([]), "INR_Rate": []})
+
+        assert write_partitions(df, str(tmp_path), "years") == []
+        assert manifest_entries(str(tmp_path), "years") == []
+
+
+class TestAnnotation:
+
+    def test_annotation_uses_manifest_without_parsing(self, processor, tmp_path):
+        out = tmp_path / "weeks"
+        out.mkdir()
+        processor.split_by_weeks(str(out))
+        annotation = tmp_path / "annotation.txt"
+
+        with patch("pandas.read_csv") as read_csv:
+            result = processor.create_annotation(str(annotation), "weeks", str(out))
+
+        read_csv.assert_not_called()
+        assert "success" in result
+        text = annotation.read_text(encoding="utf-8")
+        assert (
+            "20191230_20200105.csv: 7 записей (2019-12-30 - 2020-01-05, crc32" in text
+        )
+
+    def test_annotation_counts_rows_without_manifest(self, processor, tmp_path):
+        annotation = tmp_path / "annotation.txt"
+        with open(tmp_path / "20200101_20200102.csv", "w") as f:
+            f.write("Date,INR_Rate\n2020-01-01,1.0\n2020-01-02,2.0")
+
+        processor.create_annotation(str(annotation), "years", str(tmp_path))
+
+        text = annotation.read_text(encoding="utf-8")
+        assert "20200101_20200102.csv: 2 записей\n" in text
@@ -0,0 +1,163 @@
+import os
+import sys
+import threading
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from cbr_client import FetchError
+from data_processor import DataProcessor
+from sqlite_store import SQLITE_NAME, SQLiteRateStore
+from tests.test_data_processor import StubClient
+
+
+class TestSQLiteRateStore:
+
+    @pytest.fixture
+    def store(self, tmp_path):
+        store = SQLiteRateStore(str(tmp_path / SQLITE_NAME))
+        store.upsert_rows(
+            [["2020-01-01", 1.1, 70.0], ["2020-01-02", 1.2, ""]], ["INR", "USD"]
+        )
+        return store
+
+    def test_upsert_replaces_existing_values(self, store):
+        store.upsert_rows([["2020-01-02", 1.25]], ["INR"])
+
+        assert store.get_rate(datetime(2020, 1, 2)) == 1.25
+        assert store.get_rate(datetime(2020, 1, 2), "USD") is None
+        assert store.get_rate(datetime(2020, 1, 3)) is None
+        assert store.currencies() == ["INR", "USD"]
+        assert store.last_date() == datetime(2020, 1, 2)
+
+    def test_get_range_returns_dataset_layout(self, store):
+        df = store.get_range(datetime(2020, 1, 2), datetime(2020, 1, 31))
+
+        assert list(df.columns) == ["Date", "INR_Rate", "USD_Rate"]
+        assert df["Date"].tolist() == [pd.Timestamp("2020-01-02")]
+        assert pd.isna(df["USD_Rate"].iloc[0])
+        assert len(store.to_dataframe()) == 2
+
+    def test_reads_from_other_threads_while_writing(self, store):
+        results = []
+
+        def read():
+            results.append(store.get_rate(datetime(2020, 1, 1)))
+
+        store.upsert_rows([["2020-01-03", 1.3, 71.0]], ["INR", "USD"])
+        thread = threading.Thread(target=read)
+        thread.start()
+        thread.join()
+
+        assert results == [1.1]
+
+
+class TestSQLiteBackend:
+
+    @pytest.fixture
+    def processor(self, tmp_path):
+        pd.DataFrame(
+            {"Date": ["2020-01-01", "2020-01-02"], "INR_Rate": [0.85, 0.86]}
+        ).to_csv(tmp_path / "dataset.csv", index=False)
+        processor = DataProcessor()
+        assert processor.set_dataset_path(str(tmp_path))
+        return processor
+
+    def test_switch_imports_dataset_and_persists(self, processor, tmp_path):
+        result = processor.set_backend("sqlite")
+
+        assert result["success"]
+        assert processor.get_data_by_date(datetime(2020, 1, 2)) == 0.86
+        reopened = DataProcessor()
+        assert reopened.set_dataset_path(str(tmp_path))
+        assert reopened.backend == "sqlite"
+        assert len(reopened.current_dataset) == 2
+
+    def test_switch_merges_csv_into_existing_database(self, processor, tmp_path):
+        store = SQLiteRateStore(str(tmp_path / SQLITE_NAME))
+        store.upsert_rows([["2019-12-31", 0.84], ["2020-01-01", 0.8]], ["INR"])
+        store.close()
+
+        assert processor.set_backend("sqlite")["success"]
+
+        df = processor.current_dataset
+        assert df["Date"].dt.strftime("%Y-%m-%d").tolist() == [
+            "2019-12-31",
+            "2020-01-01",
+            "2020-01-02",
+        ]
+        assert df["INR_Rate"].tolist() == [0.84, 0.85, 0.86]
+        assert processor.get_data_by_date(datetime(2020, 1, 2)) == 0.86
+        assert processor.get_data_as_of(datetime(2020, 1, 5)) == (
+            0.86,
+            datetime(2020, 1, 2),
+        )
+
+    def test_round_trip_back_to_csv_exports_database(self, processor, tmp_path):
+        processor.set_backend("sqlite")
+        processor.client = StubClient(lambda date_str: {"INR": 0.9})
+        processor.download_new_data(end_date=datetime(2020, 1, 5), mode="incremental")
+
+        assert processor.set_backend("csv")["success"]
+
+        saved = pd.read_csv(tmp_path / "dataset.csv")
+        assert len(saved) == 5
+        reopened = DataProcessor()
+        assert reopened.set_dataset_path(str(tmp_path))
+        assert reopened.backend == "csv"
+        assert reopened.current_dataset["INR_Rate"].tolist() == [
+            0.85,
+            0.86,
+            0.9,
+            0.9,
+            0.9,
+        ]
+
+        reopened.client = StubClient(lambda date_str: {"INR": 0.95})
+        reopened.download_new_data(end_date=datetime(2020, 1, 6), mode="incremental")
+        dates = pd.read_csv(tmp_path / "dataset.csv")["Date"].tolist()
+        assert dates == [f"2020-01-0{day}" for day in range(1, 7)]
+
+    def test_download_upserts_without_dropping_history(self, processor):
+        processor.set_backend("sqlite")
+        processor.client = StubClient(lambda date_str: {"INR": 0.9})
+
+        result = processor.download_new_data(
+            datetime(2020, 1, 2), datetime(2020, 1, 4), mode="replace"
+        )
+
+        assert result["records_count"] == 3
+        assert processor.current_dataset["INR_Rate"].tolist() == [0.85, 0.9, 0.9, 0.9]
+        result = processor.download_new_data(
+            end_date=datetime(2020, 1, 4), mode="incremental"
+        )
+        assert result["records_count"] == 0
+        df = processor.get_data_by_range(datetime(2020, 1, 3), datetime(2020, 1, 4))
+        assert len(df) == 2
+
+    def test_retry_failed_upserts_queued_dates(self, processor):
+        processor.set_backend("sqlite")
+
+        def rates(date_str):
+            if date_str == "2020/01/03":
+                raise FetchError(date_str)
+            return {"INR": 0.9}
+
+        processor.client = StubClient(rates)
+        processor.download_new_data(
+            datetime(2020, 1, 3), datetime(2020, 1, 4), mode="incremental"
+        )
+        assert processor.get_failed_dates() == ["2020/01/03"]
+
+        processor.client = StubClient(lambda date_str: {"INR": 0.95})
+        result = processor.retry_failed()
+
+        assert result["records_count"] == 1
+        assert processor.get_failed_dates() == []
+        assert processor.get_data_by_date(datetime(2020, 1, 3)) == 0.95
+
+    def test_unknown_backend(self, processor):
+        assert "error" in processor.set_backend("parquet")